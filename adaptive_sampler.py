@@ -0,0 +1,259 @@
+# Adaptive question sampling (spaced repetition)
+#
+# Each question gets a weight from its SM-2 style review history: how overdue
+# it is, how often it was missed (its easiness factor) and whether it was
+# flagged. Weights live in one Fenwick tree per exam domain, and each domain's
+# total is scaled by how weak the user is in that domain, so drawing a
+# question and changing a weight are both O(log n).
+
+import math
+import random
+import time
+
+import numpy as np
+
+# SM-2 parameters
+DEFAULT_EASINESS = 2.5
+MIN_EASINESS = 1.3
+CORRECT_QUALITY = 5  # SM-2 answer quality for a correct answer
+INCORRECT_QUALITY = 2  # SM-2 answer quality for a wrong answer
+
+# Missed questions come back after minutes rather than a full day
+LAPSE_INTERVAL_DAYS = 10 / (24 * 60)
+
+# Weight multipliers
+UNSEEN_WEIGHT = 1.0
+FLAGGED_FACTOR = 2.0
+MISTAKE_FACTOR = 0.25  # Extra weight for each past mistake on a question
+MAX_MISTAKES = 8  # Past mistakes counted at most, so old trouble spots don't dominate
+MIN_URGENCY = 0.05
+MAX_URGENCY = 4.0
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class FenwickTree:
+    """Binary indexed tree over non-negative weights.
+
+    Supports O(log n) weight updates, totals and weighted draws.
+    """
+
+    def __init__(self, weights):
+        self._weights = [float(weight) for weight in weights]
+        self._size = len(self._weights)
+
+        # Build the 1-based tree in O(n)
+        tree = [0.0] + self._weights
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+        self._top_bit = 1 << (self._size.bit_length() - 1) if self._size else 0
+
+    def __len__(self):
+        return self._size
+
+    def weight(self, index):
+        return self._weights[index]
+
+    def total(self):
+        """Sum of all weights."""
+        total = 0.0
+        i = self._size
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return max(total, 0.0)
+
+    def update(self, index, weight):
+        """Set the weight at an index."""
+        delta = float(weight) - self._weights[index]
+        self._weights[index] = float(weight)
+        i = index + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """Return the index whose cumulative weight range contains value."""
+        position = 0
+        bit = self._top_bit
+        while bit:
+            candidate = position + bit
+            if candidate <= self._size and self._tree[candidate] <= value:
+                position = candidate
+                value -= self._tree[candidate]
+            bit >>= 1
+
+        # Floating point drift can push us past the last non-zero weight
+        index = min(position, self._size - 1)
+        while index > 0 and self._weights[index] <= 0:
+            index -= 1
+        return index
+
+
+class AdaptiveSampler:
+    """Weighted draws without replacement over question indices.
+
+    Questions are grouped by domain; a question's effective weight is its own
+    weight times its domain's factor.
+    """
+
+    def __init__(self, weights, domain_codes, domain_factors):
+        num_domains = len(domain_factors)
+        self._domain_codes = domain_codes
+        self._domain_factors = [float(factor) for factor in domain_factors]
+
+        # Position of each question inside its domain's tree
+        self._members = [np.flatnonzero(domain_codes == domain) for domain in range(num_domains)]
+        self._positions = np.empty(len(domain_codes), dtype=np.int32)
+        for members in self._members:
+            self._positions[members] = np.arange(len(members), dtype=np.int32)
+
+        weights = np.asarray(weights, dtype=float)
+        self._trees = [FenwickTree(weights[members]) for members in self._members]
+
+    def update(self, index, weight):
+        """Set the weight of a question."""
+        self._trees[self._domain_codes[index]].update(self._positions[index], weight)
+
+    def remove(self, index):
+        """Exclude a question from further draws."""
+        self.update(index, 0.0)
+
+    def set_domain_factor(self, domain, factor):
+        """Scale every question in a domain, in O(1)."""
+        self._domain_factors[domain] = float(factor)
+
+    def draw(self, rng=random):
+        """Draw a question index, or None if every weight is zero."""
+        totals = [factor * tree.total() for factor, tree in zip(self._domain_factors, self._trees)]
+        grand_total = math.fsum(totals)
+        if grand_total <= 0:
+            return None
+
+        value = rng.random() * grand_total
+        domain = len(totals) - 1
+        for d, total in enumerate(totals):
+            if value < total:
+                domain = d
+                break
+            value -= total
+
+        # Fall back to the last domain that still has weight
+        while totals[domain] <= 0:
+            domain -= 1
+
+        tree = self._trees[domain]
+        position = tree.find(min(value / self._domain_factors[domain], tree.total()))
+        return int(self._members[domain][position])
+
+
+class ItemHistory:
+    """SM-2 review state for one question."""
+    __slots__ = ('easiness', 'repetitions', 'interval', 'last_seen', 'mistakes', 'flagged')
+
+    def __init__(self):
+        self.easiness = DEFAULT_EASINESS
+        self.repetitions = 0
+        self.interval = 0.0  # Days until the question is due again
+        self.last_seen = 0.0
+        self.mistakes = 0
+        self.flagged = False
+
+
+class StudyHistory:
+    """A user's answer history across quizzes, keyed by QID.
+
+    Also keeps the user's own cumulative correct/answered counts per domain
+    label. These span every quiz the user has taken and are separate from the
+    current quiz's scores.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.domain_correct = {}
+        self.domain_answered = {}
+
+    def record_answer(self, qid, domain, correct, now=None):
+        """Apply an SM-2 update for a submitted answer."""
+        item = self.items.get(qid)
+        if item is None:
+            item = self.items[qid] = ItemHistory()
+
+        quality = CORRECT_QUALITY if correct else INCORRECT_QUALITY
+        item.easiness = max(
+            MIN_EASINESS,
+            item.easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02),
+        )
+        if correct:
+            item.repetitions += 1
+            if item.repetitions == 1:
+                item.interval = 1.0
+            elif item.repetitions == 2:
+                item.interval = 6.0
+            else:
+                item.interval *= item.easiness
+        else:
+            item.repetitions = 0
+            item.interval = LAPSE_INTERVAL_DAYS
+            item.mistakes += 1
+        item.last_seen = time.time() if now is None else now
+
+        self.domain_answered[domain] = self.domain_answered.get(domain, 0) + 1
+        if correct:
+            self.domain_correct[domain] = self.domain_correct.get(domain, 0) + 1
+
+    def set_flag(self, qid, flagged):
+        item = self.items.get(qid)
+        if item is None:
+            if not flagged:
+                return
+            item = self.items[qid] = ItemHistory()
+        item.flagged = flagged
+
+    def domain_scores(self, domain_labels):
+        """The cumulative per-domain counts as arrays, in the order of domain_labels."""
+        return {
+            'correct': np.array([self.domain_correct.get(label, 0) for label in domain_labels]),
+            'answered': np.array([self.domain_answered.get(label, 0) for label in domain_labels]),
+        }
+
+
+def question_weight(item, now=None):
+    """Sampling weight for a question from its review history."""
+    if item is None:
+        return UNSEEN_WEIGHT
+
+    now = time.time() if now is None else now
+    if item.interval > 0:
+        elapsed_days = (now - item.last_seen) / SECONDS_PER_DAY
+        urgency = min(max(elapsed_days / item.interval, MIN_URGENCY), MAX_URGENCY)
+    else:
+        urgency = UNSEEN_WEIGHT  # Flagged but never answered
+
+    weight = urgency * (DEFAULT_EASINESS / item.easiness)
+    weight *= 1 + MISTAKE_FACTOR * min(item.mistakes, MAX_MISTAKES)
+    if item.flagged:
+        weight *= FLAGGED_FACTOR
+    return weight
+
+
+def domain_factors(domain_scores):
+    """Per-domain weight multipliers, higher for weaker domains.
+
+    Takes the correct/answered arrays from StudyHistory.domain_scores. The
+    accuracy is smoothed so a domain with no answers yet counts as 50%.
+    """
+    accuracy = (domain_scores['correct'] + 1) / (domain_scores['answered'] + 2)
+    return 2.0 - accuracy
+
+
+def build_sampler(questions, domain_codes, domain_labels, history, now=None):
+    """Create an AdaptiveSampler over the bank from a study history."""
+    now = time.time() if now is None else now
+    weights = [question_weight(history.items.get(question.qid), now) for question in questions]
+    factors = domain_factors(history.domain_scores(domain_labels))
+    return AdaptiveSampler(weights, domain_codes, factors)
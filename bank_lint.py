@@ -0,0 +1,225 @@
+# Question bank validation
+#
+# Checks every row of the bank in a few vectorized passes: answer letters
+# against the options that are actually filled in, duplicated options,
+# "(Choose two.)" against the number of correct answers, malformed URLs and
+# exam domains that don't match the blueprint. Errors are rows that would
+# break or mis-grade a quiz; they are left out of the bank the app loads.
+# Warnings are only reported.
+#
+# Results are cached next to the bank, keyed by the CSV's content hash, so a
+# warm start only hashes the file and reads the cache.
+#
+# Usage: python bank_lint.py [--errors-only] [--out issues.csv]
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from exam_blueprint import DOMAIN_WEIGHT_PATTERN
+from question_bank import (
+    BANK_CSV, COMPILED_BANK, OPTION_LETTERS, QuestionBank, build_questions, compiled_path_for, file_sha256,
+    read_bank, temp_path
+)
+
+LINT_CACHE = 'all_questions.lint.json'
+LINT_VERSION = 1  # Bump when the checks change, so cached results are redone
+
+ERROR = 'error'
+WARNING = 'warning'
+
+ISSUE_COLUMNS = ['Row', 'QID', 'Severity', 'Check', 'Message']
+
+CHOOSE_PATTERN = re.compile(r'\(\s*choose\s+(\w+)\s*\.?\s*\)', re.IGNORECASE)
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6}
+
+URL_PATTERN = re.compile(r'^https?://[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+(:\d+)?([/?#]\S*)?$')
+
+logger = logging.getLogger(__name__)
+
+
+def _issues(data, rows, severity, check, messages):
+    """Issue records for the given row labels (messages: one string, or one per row)."""
+    rows = pd.Index(rows)
+    if isinstance(messages, str):
+        messages = [messages] * len(rows)
+    return pd.DataFrame({
+        'Row': rows.to_numpy(dtype=np.int64),
+        'QID': data['QID'].reindex(rows).to_numpy(),
+        'Severity': severity,
+        'Check': check,
+        'Message': list(messages),
+    }, columns=ISSUE_COLUMNS)
+
+
+def lint_bank(data):
+    """Validate a prepared bank DataFrame and return its issues, one per row and problem."""
+    found = []
+
+    # Questions
+    question_text = data['QUESTION'].fillna('').astype(str).str.strip()
+    found.append(_issues(data, data.index[question_text.eq('')], ERROR, 'missing_question',
+                         "Question text is empty"))
+    duplicated_qids = data['QID'].duplicated()
+    found.append(_issues(data, data.index[duplicated_qids], ERROR, 'duplicate_qid',
+                         "QID is used by an earlier row"))
+
+    # Options: filled in, and not repeated within a question
+    option_text = pd.DataFrame({letter: data[letter].fillna('').astype(str).str.strip() for letter in OPTION_LETTERS})
+    filled = option_text.ne('').to_numpy()
+    stacked = option_text.stack()
+    stacked = stacked[stacked.ne('')].str.replace(r'\s+', ' ', regex=True)  # Case matters in SQL options
+    repeated = pd.Series(stacked.to_numpy(), index=stacked.index.get_level_values(0))
+    repeated = repeated.reset_index().duplicated().to_numpy()
+    found.append(_issues(data, stacked.index.get_level_values(0)[repeated].unique(), ERROR, 'duplicate_options',
+                         "Two options have the same text"))
+
+    # Answer key: present, and every letter pointing at a filled-in option
+    answer = data['CORRECT ANSWER'].fillna('').astype(str).str.strip()
+    found.append(_issues(data, data.index[answer.eq('')], ERROR, 'missing_answer', "CORRECT ANSWER is empty"))
+
+    letters = data['Correct Letters'].explode().dropna()
+    letter_columns = letters.map({letter: i for i, letter in enumerate(OPTION_LETTERS)})
+    unknown = letter_columns.isna()
+    found.append(_issues(data, letters.index[unknown], ERROR, 'unknown_answer_letter',
+                         [f"Answer letter '{letter}' is not one of {', '.join(OPTION_LETTERS)}"
+                          for letter in letters[unknown]]))
+    known = letters[~unknown]
+    positions = data.index.get_indexer(known.index)
+    empty = ~filled[positions, letter_columns[~unknown].to_numpy(dtype=int)]
+    found.append(_issues(data, known.index[empty], ERROR, 'answer_without_option',
+                         [f"Answer letter '{letter}' points at an empty option" for letter in known[empty]]))
+    repeated_letters = letters.reset_index().duplicated().to_numpy()
+    found.append(_issues(data, letters.index[repeated_letters].unique(), ERROR, 'repeated_answer_letter',
+                         "An answer letter is listed twice"))
+
+    # "(Choose N.)" against the number of correct answers
+    num_correct = data['Correct Letters'].str.len()
+    choose_word = question_text.str.extract(CHOOSE_PATTERN, expand=False).str.lower()
+    choose = pd.to_numeric(choose_word.map(NUMBER_WORDS).fillna(choose_word), errors='coerce')
+    mismatch = choose.notna() & num_correct.gt(0) & choose.ne(num_correct)
+    found.append(_issues(data, data.index[mismatch], ERROR, 'choose_count',
+                         [f"Question says choose {int(wanted)} but {count} answer(s) are marked"
+                          for wanted, count in zip(choose[mismatch], num_correct[mismatch])]))
+    unannounced = choose.isna() & num_correct.gt(1)
+    found.append(_issues(data, data.index[unannounced], WARNING, 'choose_missing',
+                         [f"{count} answers are marked but the question doesn't say how many to choose"
+                          for count in num_correct[unannounced]]))
+
+    # URLs
+    doc_urls = data['Doc URLs'].explode().dropna()
+    bad_doc_urls = ~doc_urls.str.match(URL_PATTERN)
+    found.append(_issues(data, doc_urls.index[bad_doc_urls], WARNING, 'malformed_doc_url',
+                         [f"Malformed documentation URL: {url}" for url in doc_urls[bad_doc_urls]]))
+    documentation = data['Snowflake Documentation'].fillna('').astype(str).str.strip()
+    no_links = documentation.ne('') & data['Doc URLs'].str.len().eq(0)
+    found.append(_issues(data, data.index[no_links], WARNING, 'doc_without_url',
+                         "Snowflake Documentation has no link in it"))
+    image_urls = data['Image URL'].dropna().astype(str).str.strip()
+    image_urls = image_urls[image_urls.ne('')]
+    bad_image_urls = ~image_urls.str.match(URL_PATTERN)
+    found.append(_issues(data, image_urls.index[bad_image_urls], WARNING, 'malformed_image_url',
+                         [f"Malformed image URL: {url}" for url in image_urls[bad_image_urls]]))
+
+    # Exam domains: present, in the "<n> <name> (<p>%)" form, and spelled like the rest of the bank
+    domain = data['Exam Domain'].fillna('').astype(str).str.strip()
+    found.append(_issues(data, data.index[domain.eq('')], WARNING, 'missing_domain', "Exam Domain is empty"))
+    sections = domain.str.findall(DOMAIN_WEIGHT_PATTERN)
+    unparsed = domain.ne('') & sections.str.len().eq(0)
+    found.append(_issues(data, data.index[unparsed], WARNING, 'unknown_domain',
+                         [f"Exam Domain '{label}' doesn't name a blueprint domain" for label in domain[unparsed]]))
+    named = sections.explode().dropna()
+    if len(named):
+        named = pd.DataFrame(named.tolist(), index=named.index, columns=['number', 'name', 'percent'])
+        named['spelling'] = named['name'].str.strip() + ' (' + named['percent'] + '%)'
+        usual = named.groupby('number')['spelling'].agg(lambda spellings: spellings.mode().iloc[0])
+        odd = named['spelling'].ne(named['number'].map(usual))
+        found.append(_issues(data, named.index[odd], WARNING, 'inconsistent_domain',
+                             [f"Domain {number} is written '{spelling}', usually '{usual[number]}'"
+                              for number, spelling in zip(named['number'][odd], named['spelling'][odd])]))
+
+    issues = pd.concat(found, ignore_index=True)
+    return issues.sort_values(['Row', 'Severity', 'Check'], kind='stable', ignore_index=True)
+
+
+def lint_cache_for(csv_path):
+    """Lint cache path for a CSV: LINT_CACHE for the app's bank, None (not cached) for any other."""
+    return LINT_CACHE if compiled_path_for(csv_path) is not None else None
+
+
+def check_bank(csv_path=BANK_CSV, compiled_path=COMPILED_BANK, cache_path=LINT_CACHE, data=None):
+    """The bank's issues, from the cache when the CSV hasn't changed since they were found.
+
+    With cache_path None the bank is checked every time.
+    """
+    if cache_path is not None:
+        source_hash = file_sha256(csv_path)
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached['source_sha256'] == source_hash and cached['lint_version'] == LINT_VERSION:
+                return pd.DataFrame(cached['issues'], columns=ISSUE_COLUMNS)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    if data is None:
+        data = read_bank(csv_path, compiled_path)
+    issues = lint_bank(data)
+    if cache_path is None:
+        return issues
+
+    # Write to a temporary file first so readers never see a partial cache
+    try:
+        tmp_path = temp_path(cache_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'source_sha256': source_hash, 'lint_version': LINT_VERSION,
+                       'issues': issues.to_dict('records')}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # The cache is an optimization; the issues are still returned
+    return issues
+
+
+def load_checked_bank(csv_path=BANK_CSV, compiled_path=COMPILED_BANK, version=0, cache_path=LINT_CACHE):
+    """Load the question bank without the rows that failed validation."""
+    data = read_bank(csv_path, compiled_path)
+    issues = check_bank(csv_path, compiled_path, cache_path, data)
+    error_rows = issues.loc[issues['Severity'] == ERROR, 'Row'].unique()
+    if len(error_rows):
+        logger.warning("Left out %d question(s) with errors; run 'python bank_lint.py' for details",
+                       len(error_rows))
+        data = data.drop(index=error_rows)
+    return QuestionBank(build_questions(data), version)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the question bank for malformed questions.")
+    parser.add_argument('--csv', default=BANK_CSV, help="Path to the question bank CSV.")
+    parser.add_argument('--errors-only', action='store_true', help="Only report errors, not warnings.")
+    parser.add_argument('--out', help="Also write the issues to this CSV file.")
+    args = parser.parse_args(argv)
+
+    issues = check_bank(args.csv, compiled_path_for(args.csv), lint_cache_for(args.csv))
+    if args.errors_only:
+        issues = issues[issues['Severity'] == ERROR]
+
+    if args.out:
+        issues.to_csv(args.out, index=False)
+
+    for row in issues.itertuples(index=False):
+        print(f"QID {row.QID} (row {row.Row + 1}): {row.Severity}: {row.Message} [{row.Check}]")
+    counts = issues['Severity'].value_counts()
+    print(f"{counts.get(ERROR, 0)} error(s), {counts.get(WARNING, 0)} warning(s)")
+
+    # A non-zero exit lets the check gate commits or CI
+    sys.exit(1 if counts.get(ERROR, 0) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Question bank hot-reload
+#
+# A background thread polls the bank CSV. When its mtime or size changes the
+# file is hashed, and if the contents really changed it is re-parsed (and
+# recompiled) off the request path into a new, versioned QuestionBank. The
+# new snapshot is swapped in with a single reference assignment, so readers
+# always see a complete bank. Quizzes keep a reference to the snapshot they
+# started on; an old snapshot is freed as soon as the last quiz using it is
+# gone, since the watcher itself only holds the current one. Processes
+# serving a published shared bank file watch that file the same way.
+
+import logging
+import os
+import threading
+import weakref
+
+from instrumentation import count, span
+from bank_lint import load_checked_bank
+from question_bank import BANK_CSV, file_sha256
+
+POLL_INTERVAL = 5  # Seconds between checks of the CSV
+
+logger = logging.getLogger(__name__)
+
+
+class BankWatcher:
+    """Holds the current QuestionBank snapshot and reloads it when the CSV changes.
+
+    load(version=...) builds a bank from the watched file; the default parses
+    the bank CSV, leaving out questions that fail validation.
+    """
+
+    def __init__(self, path=BANK_CSV, load=load_checked_bank, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.load = load
+        self.poll_interval = poll_interval
+
+        self._stat = self._file_stat()
+        self._source_hash = file_sha256(path)
+        self.current = load(version=1)
+
+        # Snapshots still referenced somewhere (by the watcher or by a quiz)
+        self._snapshots = weakref.WeakValueDictionary({self.current.version: self.current})
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch_loop, name='bank-watcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def live_versions(self):
+        """Versions of the bank that are still in memory, oldest first."""
+        return sorted(self._snapshots.keys())
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Reload the bank if the file changed; return True if a new snapshot was swapped in."""
+        try:
+            stat = self._file_stat()
+            if stat == self._stat:
+                return False
+            self._stat = stat
+            source_hash = file_sha256(self.path)
+        except OSError:
+            return False  # Mid-rename or briefly missing; look again on the next poll
+        if source_hash == self._source_hash:
+            return False  # Touched but not changed
+
+        try:
+            with span('bank_reload'):
+                bank = self.load(version=self.current.version + 1)
+        except Exception:
+            # Any failure must leave the watcher thread running on the last good
+            # snapshot; a fixed file has a new mtime and is retried
+            logger.exception("Keeping bank version %d, could not load '%s'", self.current.version, self.path)
+            return False
+
+        self._source_hash = source_hash
+        self._snapshots[bank.version] = bank
+        self.current = bank
+        count('bank_reload')
+        return True
+
+    def _watch_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
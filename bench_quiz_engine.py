@@ -0,0 +1,169 @@
+# Benchmark for the headless quiz engine
+#
+# Simulates many concurrent sessions each working through a full quiz:
+# every session shows a question, sometimes flags it, answers it, refreshes
+# its review row and moves on, interleaved with all the other sessions the
+# way Streamlit interleaves reruns. Reports latency percentiles for each
+# operation and the memory held per session.
+#
+# Usage: python bench_quiz_engine.py --sessions 2000 --questions 1005 --threads 8
+
+import argparse
+import gc
+import random
+import threading
+import time
+import tracemalloc
+from array import array
+
+import numpy as np
+
+from question_bank import load_question_bank
+from quiz_engine import QUIZ_MODES, QuizEngine
+
+OPERATIONS = ['show', 'flag', 'answer', 'review_row', 'next', 'score', 'review_table']
+
+CORRECT_RATE = 0.7
+FLAG_RATE = 0.1
+
+
+def pick_answer(question, rng):
+    """Answer letters for a simulated user: usually right, sometimes not."""
+    if rng.random() < CORRECT_RATE:
+        return list(question.correct_letters)
+    return rng.sample(question.option_letters, len(question.correct_letters))
+
+
+def run_sessions(quizzes, timings, seed):
+    """Drive a group of sessions through their quizzes, one step per session in turn."""
+    rng = random.Random(seed)
+    clock = time.perf_counter_ns
+    active = list(quizzes)
+
+    while active:
+        still_active = []
+        for quiz in active:
+            number = quiz.current
+
+            start = clock()
+            quiz.mark_shown(number)
+            quiz.options(number)
+            timings['show'].append(clock() - start)
+
+            if rng.random() < FLAG_RATE:
+                start = clock()
+                quiz.flag(number, True)
+                timings['flag'].append(clock() - start)
+
+            selected = pick_answer(quiz.question(number), rng)
+            start = clock()
+            quiz.answer(number, selected)
+            timings['answer'].append(clock() - start)
+
+            start = clock()
+            quiz.review_row(number)
+            timings['review_row'].append(clock() - start)
+
+            start = clock()
+            quiz.next()
+            timings['next'].append(clock() - start)
+
+            if quiz.finished:
+                start = clock()
+                quiz.domain_breakdown()
+                quiz.percentage
+                timings['score'].append(clock() - start)
+
+                start = clock()
+                quiz.review_dataframe()
+                timings['review_table'].append(clock() - start)
+            else:
+                still_active.append(quiz)
+        active = still_active
+
+
+def measure_session_memory(bank, num_questions, mode, count):
+    """Average bytes allocated per session for a fully answered quiz."""
+    rng = random.Random(0)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+
+    quizzes = [QuizEngine.start(bank, num_questions, mode, rng=rng) for _ in range(count)]
+    for quiz in quizzes:
+        while not quiz.finished:
+            quiz.mark_shown(quiz.current)
+            quiz.options(quiz.current)
+            quiz.answer(quiz.current, pick_answer(quiz.question(quiz.current), rng))
+            quiz.next()
+
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in snapshot.compare_to(baseline, 'filename'))
+    del quizzes
+    return allocated / count
+
+
+def format_ns(ns):
+    if ns >= 1_000_000:
+        return f"{ns / 1_000_000:.2f}ms"
+    return f"{ns / 1000:.1f}us"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the quiz engine with many simulated sessions.")
+    parser.add_argument('--sessions', type=int, default=1000, help="Number of concurrent sessions.")
+    parser.add_argument('--questions', type=int, default=1005, help="Questions per quiz.")
+    parser.add_argument('--threads', type=int, default=4, help="Threads the sessions are spread over.")
+    parser.add_argument('--mode', choices=QUIZ_MODES, default="Random", help="Quiz mode.")
+    parser.add_argument('--memory-sessions', type=int, default=50,
+                        help="Sessions used to measure per-session memory (0 to skip).")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    bank = load_question_bank()
+    num_questions = min(args.questions, len(bank))
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    quizzes = [QuizEngine.start(bank, num_questions, args.mode, rng=rng) for _ in range(args.sessions)]
+    start_seconds = time.perf_counter() - start
+
+    # One set of timing arrays per thread, merged afterwards
+    groups = [quizzes[i::args.threads] for i in range(args.threads)]
+    thread_timings = [{operation: array('q') for operation in OPERATIONS} for _ in groups]
+    threads = [
+        threading.Thread(target=run_sessions, args=(group, timings, args.seed + i))
+        for i, (group, timings) in enumerate(zip(groups, thread_timings))
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    run_seconds = time.perf_counter() - start
+
+    print(f"{args.sessions} sessions x {num_questions} questions ({args.mode}), {args.threads} threads")
+    print(f"start: {start_seconds / args.sessions * 1e6:.1f}us/session, "
+          f"run: {run_seconds:.1f}s ({args.sessions * num_questions / run_seconds:,.0f} answers/s)")
+    print()
+    print(f"{'operation':<14}{'count':>12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for operation in OPERATIONS:
+        samples = np.concatenate([np.frombuffer(timings[operation], dtype=np.int64) for timings in thread_timings])
+        if not len(samples):
+            continue
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        print(f"{operation:<14}{len(samples):>12,}{format_ns(p50):>10}{format_ns(p95):>10}"
+              f"{format_ns(p99):>10}{format_ns(samples.max()):>10}")
+
+    if args.memory_sessions:
+        del quizzes, groups
+        per_session = measure_session_memory(bank, num_questions, args.mode, args.memory_sessions)
+        print()
+        print(f"memory: {per_session / 1024:.1f} KiB per session (fully answered, {args.memory_sessions} sessions)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# Cohort analytics
+#
+# Every graded answer updates per-question counters (attempts, correct,
+# how often each option was chosen, time to answer) in constant time, and is
+# appended to a compact response log. The item report is computed from those
+# in a few vectorized passes:
+#
+#   difficulty      share of attempts answered correctly (lower is harder)
+#   discrimination  point-biserial correlation between getting the question
+#                   right and the respondent's accuracy on their other answers
+#   likely wrong key  a distractor was chosen more often than a marked answer
+#
+# Usage: python cohort_analytics.py [--db study_progress.db] [--out report.csv]
+
+import argparse
+import threading
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from progress_store import PROGRESS_DB, ProgressStore
+from question_bank import OPTION_LETTERS, load_question_bank
+
+# Attempts a question needs before its answer key is judged
+MIN_KEY_ATTEMPTS = 20
+
+INITIAL_CAPACITY = 2048
+
+REPORT_COLUMNS = [
+    'QID', 'Attempts', 'Correct', 'Difficulty', 'Discrimination', 'Mean Seconds',
+    *OPTION_LETTERS, 'Likely Wrong Key'
+]
+
+_LETTER_INDEX = {letter: i for i, letter in enumerate(OPTION_LETTERS)}
+
+
+class CohortStats:
+    """Per-question answer counters and a response log, shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}  # qid -> row in the counters
+        self._users = {}  # user_id -> index in the response log
+
+        self.attempts = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.correct = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.option_counts = np.zeros((INITIAL_CAPACITY, len(OPTION_LETTERS)), dtype=np.int64)
+        self.seconds_total = np.zeros(INITIAL_CAPACITY)
+        self.timed_attempts = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+
+        # One entry per answer, for the discrimination index
+        self._log_item = array('i')
+        self._log_user = array('i')
+        self._log_correct = array('b')
+
+    @classmethod
+    def from_progress(cls, progress):
+        """Counters seeded with every answer saved in a progress store."""
+        stats = cls()
+        for user_id, qid, selected, correct, seconds in progress.all_answers():
+            stats.record(user_id, qid, selected, correct, seconds)
+        return stats
+
+    def __len__(self):
+        return len(self._items)
+
+    def _item(self, qid):
+        # Called with the lock held
+        item = self._items.get(qid)
+        if item is None:
+            item = self._items[qid] = len(self._items)
+            if item == len(self.attempts):
+                self._grow()
+        return item
+
+    def _grow(self):
+        for name in ('attempts', 'correct', 'option_counts', 'seconds_total', 'timed_attempts'):
+            counters = getattr(self, name)
+            grown = np.zeros((len(counters) * 2, *counters.shape[1:]), dtype=counters.dtype)
+            grown[:len(counters)] = counters
+            setattr(self, name, grown)
+
+    def record(self, user_id, qid, selected, correct, seconds=None):
+        """Count one graded answer."""
+        with self._lock:
+            item = self._item(qid)
+            user = self._users.setdefault(user_id, len(self._users))
+
+            self.attempts[item] += 1
+            self.correct[item] += correct
+            for letter in selected:
+                self.option_counts[item, _LETTER_INDEX[letter]] += 1
+            if seconds is not None:
+                self.seconds_total[item] += seconds
+                self.timed_attempts[item] += 1
+
+            self._log_item.append(item)
+            self._log_user.append(user)
+            self._log_correct.append(correct)
+
+    def report(self, bank=None, min_key_attempts=MIN_KEY_ATTEMPTS):
+        """Item statistics for every answered question as a DataFrame.
+
+        The answer-key check needs the bank's correct letters; without a bank
+        no key is flagged.
+        """
+        with self._lock:
+            count = len(self._items)
+            qids = list(self._items)
+            attempts = self.attempts[:count].copy()
+            correct = self.correct[:count].copy()
+            option_counts = self.option_counts[:count].copy()
+            seconds_total = self.seconds_total[:count].copy()
+            timed_attempts = self.timed_attempts[:count].copy()
+            log_item = np.frombuffer(self._log_item, dtype=np.int32).copy()
+            log_user = np.frombuffer(self._log_user, dtype=np.int32).copy()
+            log_correct = np.frombuffer(self._log_correct, dtype=np.int8).astype(float)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            difficulty = correct / attempts
+            mean_seconds = seconds_total / timed_attempts
+            discrimination = point_biserial(log_item, log_user, log_correct, count)
+
+        # A distractor chosen more often than the least chosen marked answer
+        likely_wrong_key = np.zeros(count, dtype=bool)
+        if bank is not None:
+            keys = np.zeros((count, len(OPTION_LETTERS)), dtype=bool)
+            for item, qid in enumerate(qids):
+                index = bank.qid_lookup.get(qid)
+                if index is not None:
+                    keys[item, [_LETTER_INDEX[letter] for letter in bank[index].correct_letters]] = True
+            has_key = keys.any(axis=1)
+            weakest_key = np.where(keys, option_counts, np.iinfo(np.int64).max).min(axis=1)
+            strongest_distractor = np.where(keys, -1, option_counts).max(axis=1)
+            likely_wrong_key = has_key & (attempts >= min_key_attempts) & (strongest_distractor > weakest_key)
+
+        report = pd.DataFrame({
+            'QID': qids,
+            'Attempts': attempts,
+            'Correct': correct,
+            'Difficulty': difficulty,
+            'Discrimination': discrimination,
+            'Mean Seconds': mean_seconds,
+            **{letter: option_counts[:, i] for i, letter in enumerate(OPTION_LETTERS)},
+            'Likely Wrong Key': likely_wrong_key,
+        }, columns=REPORT_COLUMNS)
+        return report
+
+
+def point_biserial(item, user, correct, num_items):
+    """Point-biserial discrimination per item from a response log.
+
+    Each response is paired with the respondent's accuracy on their other
+    answers (the rest score), so a question doesn't correlate with itself.
+    Items where either side has no variance get NaN.
+    """
+    user_attempts = np.bincount(user)
+    user_correct = np.bincount(user, weights=correct)
+    others = user_attempts[user] - 1
+    answered_others = others > 0
+    item, correct = item[answered_others], correct[answered_others]
+    rest = (user_correct[user[answered_others]] - correct) / others[answered_others]
+
+    n = np.bincount(item, minlength=num_items)
+    mean_correct = np.bincount(item, weights=correct, minlength=num_items) / n
+    mean_rest = np.bincount(item, weights=rest, minlength=num_items) / n
+    covariance = np.bincount(item, weights=correct * rest, minlength=num_items) / n - mean_correct * mean_rest
+    rest_variance = np.bincount(item, weights=rest * rest, minlength=num_items) / n - mean_rest ** 2
+    correct_variance = mean_correct * (1 - mean_correct)
+    return covariance / np.sqrt(correct_variance * np.maximum(rest_variance, 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Item difficulty, discrimination and answer-key checks.")
+    parser.add_argument('--db', default=PROGRESS_DB, help="Progress database to read answers from.")
+    parser.add_argument('--out', help="Write the full item report to this CSV file.")
+    parser.add_argument('--min-attempts', type=int, default=MIN_KEY_ATTEMPTS,
+                        help="Attempts a question needs before its answer key is checked.")
+    args = parser.parse_args(argv)
+
+    progress = ProgressStore(args.db)
+    stats = CohortStats.from_progress(progress)
+    progress.close()
+    report = stats.report(load_question_bank(), args.min_attempts)
+
+    if args.out:
+        report.to_csv(args.out, index=False)
+        print(f"Wrote statistics for {len(report)} questions to '{args.out}'.")
+
+    suspects = report[report['Likely Wrong Key']]
+    print(f"{report['Attempts'].sum()} answers to {len(report)} questions; "
+          f"{len(suspects)} question(s) with a likely wrong answer key")
+    if len(suspects):
+        print(suspects[['QID', 'Attempts', 'Difficulty', 'Discrimination', *OPTION_LETTERS]].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
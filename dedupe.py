@@ -0,0 +1,213 @@
+# Near-duplicate question detection
+#
+# Each question (its stem plus its set of options, so reordered options look
+# the same) is reduced to word shingles, then to a MinHash signature. LSH
+# banding over the signatures finds candidate pairs without comparing every
+# pair of questions; candidates are confirmed with their exact Jaccard
+# similarity and grouped into clusters with union-find.
+#
+# Usage: python dedupe.py [--threshold 0.6] [--report duplicates_report.txt]
+#
+# Writes a canonical-ID mapping (every clustered QID -> the cluster's lowest
+# QID) that the app uses to quiz on at most one question per cluster.
+
+import argparse
+import csv
+import os
+import random
+import re
+import zlib
+
+import numpy as np
+
+from question_bank import BANK_CSV, compiled_path_for, load_questions
+
+DUPLICATES_CSV = 'duplicate_clusters.csv'
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32  # 4 rows per band: pairs above ~0.4 similarity usually become candidates
+DEFAULT_THRESHOLD = 0.6
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+_MASK_32 = np.uint64(0xFFFFFFFF)
+
+
+def shingles(question):
+    """Word shingles of a question's stem and of each of its options."""
+    result = set()
+    parts = [('q', question.text)] + [('o', option) for option in question.options if option]
+    for tag, text in parts:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        if len(tokens) < SHINGLE_SIZE:
+            result.add(f"{tag}:{' '.join(tokens)}")
+            continue
+        for i in range(len(tokens) - SHINGLE_SIZE + 1):
+            result.add(f"{tag}:{' '.join(tokens[i:i + SHINGLE_SIZE])}")
+    return result
+
+
+def minhash_signatures(shingle_sets, num_permutations=NUM_PERMUTATIONS, seed=1):
+    """MinHash signature matrix (questions x permutations) using multiply-shift hashing."""
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2**63, size=num_permutations, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2**63, size=num_permutations, dtype=np.uint64)
+
+    signatures = np.full((len(shingle_sets), num_permutations), np.iinfo(np.uint32).max, dtype=np.uint32)
+    with np.errstate(over='ignore'):
+        for row, shingle_set in enumerate(shingle_sets):
+            if not shingle_set:
+                continue
+            hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+            permuted = (multipliers[:, None] * hashes[None, :] + offsets[:, None]) >> np.uint64(32)
+            signatures[row] = (permuted & _MASK_32).min(axis=1)
+    return signatures
+
+
+def candidate_pairs(signatures, num_bands=NUM_BANDS):
+    """Pairs of rows whose signatures agree on at least one whole band."""
+    rows_per_band = signatures.shape[1] // num_bands
+    pairs = set()
+    for band in range(num_bands):
+        buckets = {}
+        chunk = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for row, key in enumerate(map(bytes, chunk)):
+            buckets.setdefault(key, []).append(row)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pairs.add((members[i], members[j]))
+    return pairs
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _qid_order(qid):
+    return (0, int(qid), '') if qid.isdigit() else (1, 0, qid)
+
+
+def find_duplicate_clusters(questions, threshold=DEFAULT_THRESHOLD):
+    """Group near-duplicate questions into clusters.
+
+    Returns {canonical QID: (member indices, [(index, index, similarity), ...])},
+    where the canonical QID is the cluster's lowest and the pairs are the
+    confirmed duplicate pairs inside the cluster.
+    """
+    shingle_sets = [shingles(question) for question in questions]
+    signatures = minhash_signatures(shingle_sets)
+
+    # Union-find over confirmed pairs
+    parent = list(range(len(questions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    confirmed = []
+    for i, j in candidate_pairs(signatures):
+        similarity = jaccard(shingle_sets[i], shingle_sets[j])
+        if similarity >= threshold:
+            confirmed.append((i, j, similarity))
+            parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(questions)):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda index: _qid_order(questions[index].qid))
+        clusters[questions[members[0]].qid] = (members, [])
+    member_cluster = {index: canonical for canonical, (members, _) in clusters.items() for index in members}
+    for i, j, similarity in confirmed:
+        clusters[member_cluster[i]][1].append((i, j, similarity))
+    return clusters
+
+
+def write_canonical_ids(questions, clusters, path=DUPLICATES_CSV):
+    """Write the QID -> canonical QID mapping for every clustered question."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['QID', 'Canonical QID'])
+        for canonical, (members, _) in sorted(clusters.items(), key=lambda item: _qid_order(item[0])):
+            for index in members:
+                writer.writerow([questions[index].qid, canonical])
+
+
+def load_canonical_ids(path=DUPLICATES_CSV):
+    """Read the QID -> canonical QID mapping, or an empty mapping if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as f:
+        return {row['QID']: row['Canonical QID'] for row in csv.DictReader(f)}
+
+
+def cluster_keys(bank, canonical_ids):
+    """Per bank index, the index of its cluster's first question (its own index if unclustered)."""
+    keys = np.arange(len(bank), dtype=np.int32)
+    first_index = {}
+    for qid, canonical in canonical_ids.items():
+        index = bank.qid_lookup.get(qid)
+        if index is not None:
+            keys[index] = first_index.setdefault(canonical, index)
+    return keys
+
+
+def one_per_cluster(pool, keys, rng=random):
+    """A random member of each cluster represented in pool, as a list of bank indices."""
+    pool = list(pool)
+    rng.shuffle(pool)
+    seen = set()
+    result = []
+    for index in pool:
+        key = keys[index]
+        if key not in seen:
+            seen.add(key)
+            result.append(index)
+    return result
+
+
+def format_report(questions, clusters):
+    lines = [f"{len(clusters)} near-duplicate cluster(s), "
+             f"{sum(len(members) for members, _ in clusters.values())} questions"]
+    for canonical, (members, pairs) in sorted(clusters.items(), key=lambda item: _qid_order(item[0])):
+        lines.append("")
+        lines.append(f"Cluster {canonical}:")
+        for index in members:
+            lines.append(f"  QID {questions[index].qid}: {questions[index].text[:100]!r}")
+        for i, j, similarity in sorted(pairs, key=lambda pair: -pair[2]):
+            lines.append(f"    {questions[i].qid} ~ {questions[j].qid}: {similarity:.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find near-duplicate questions in the question bank.")
+    parser.add_argument('--csv', default=BANK_CSV, help="Path to the question bank CSV.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Minimum shingle Jaccard similarity for two questions to count as duplicates.")
+    parser.add_argument('--mapping', default=DUPLICATES_CSV, help="Where to write the canonical-ID mapping.")
+    parser.add_argument('--report', help="Write the report to this file instead of printing it.")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.csv, compiled_path_for(args.csv))
+    clusters = find_duplicate_clusters(questions, args.threshold)
+    write_canonical_ids(questions, clusters, args.mapping)
+
+    report = format_report(questions, clusters)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(report + '\n')
+        print(f"Found {len(clusters)} cluster(s); report written to '{args.report}'.")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
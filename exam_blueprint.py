@@ -0,0 +1,85 @@
+# Exam blueprint for mock exams
+#
+# The exam's domain weights are part of the domain labels in the bank, e.g.
+# "3.0 Performance Concepts (15%)". The blueprint parses them once per bank,
+# keeps an index array of the bank questions in each domain, and draws
+# stratified samples whose domain mix matches the weights. Questions tagged
+# with more than one domain count towards the first.
+
+import random
+import re
+
+import numpy as np
+
+# "<section number> <name> (<percent>%)", possibly several per label
+DOMAIN_WEIGHT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s+([^,()]+?)\s*\((\d+(?:\.\d+)?)%\)')
+
+
+def parse_domain_weights(label):
+    """[(section number, name, percent), ...] for each exam domain named in a domain label."""
+    return [(number, name, float(percent)) for number, name, percent in DOMAIN_WEIGHT_PATTERN.findall(label)]
+
+
+class ExamBlueprint:
+    """Exam domains with their weights and the bank indices in each."""
+
+    def __init__(self, domain_labels, domain_codes):
+        parsed = [parse_domain_weights(label) for label in domain_labels]
+
+        sections = {}  # section number -> (name, percent)
+        for domains in parsed:
+            for number, name, percent in domains:
+                sections.setdefault(number, (name, percent))
+        numbers = sorted(sections, key=float)
+        positions = {number: position for position, number in enumerate(numbers)}
+
+        self.names = [f"{number} {sections[number][0]}" for number in numbers]
+        self.weights = np.array([sections[number][1] for number in numbers])
+
+        # Blueprint section of every domain code, then of every bank question (-1: none)
+        code_sections = np.array([positions[domains[0][0]] if domains else -1 for domains in parsed], dtype=np.int8)
+        self.section_of = code_sections[domain_codes]
+        self.indices = [np.flatnonzero(self.section_of == section) for section in range(len(numbers))]
+
+    def __len__(self):
+        return len(self.names)
+
+    def allocate(self, num_questions, available=None):
+        """Questions per section for a quiz of num_questions, by largest remainder.
+
+        Sections with fewer than their share of available questions are
+        capped and the shortfall goes to the sections with the largest
+        remaining share.
+        """
+        if available is None:
+            available = np.array([len(indices) for indices in self.indices])
+        num_questions = min(num_questions, int(available.sum()))
+        if not len(self) or not num_questions:
+            return np.zeros(len(self), dtype=int)
+
+        quotas = self.weights / self.weights.sum() * num_questions
+        counts = np.minimum(np.floor(quotas).astype(int), available)
+        while counts.sum() < num_questions:
+            open_sections = counts < available
+            shortfall = np.where(open_sections, quotas - counts, -np.inf)
+            counts[np.argmax(shortfall)] += 1
+        return counts
+
+    def sample(self, num_questions, rng=random, pool=None):
+        """A stratified random sample of bank indices following the blueprint, shuffled.
+
+        pool optionally restricts the sample to a list of bank indices.
+        """
+        if pool is None:
+            section_indices = self.indices
+        else:
+            pool = np.asarray(pool, dtype=np.int32)
+            pool_sections = self.section_of[pool]
+            section_indices = [pool[pool_sections == section] for section in range(len(self))]
+
+        counts = self.allocate(num_questions, np.array([len(indices) for indices in section_indices]))
+        selected = []
+        for indices, count in zip(section_indices, counts):
+            selected.extend(int(indices[position]) for position in rng.sample(range(len(indices)), int(count)))
+        rng.shuffle(selected)
+        return selected
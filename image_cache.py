@@ -0,0 +1,225 @@
+# Question image cache
+#
+# Question images are fetched once, downscaled to the width the app displays
+# them at, and kept in a content-addressed directory on disk (capped in size,
+# least recently used images evicted first) plus a small in-memory cache.
+# Images for upcoming questions can be prefetched on background threads so
+# they are ready by the time the question is shown.
+
+import hashlib
+import http.client
+import io
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from instrumentation import count, span
+
+IMAGE_CACHE_DIR = '.image_cache'
+
+# Twice the 704px width of Streamlit's centered layout, so images stay sharp on high-DPI screens
+DISPLAY_WIDTH = 1408
+
+MAX_DISK_BYTES = 200 * 1024 * 1024
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+
+FETCH_TIMEOUT = 10  # Seconds
+RETRY_AFTER = 60  # Seconds before a failed URL is fetched again
+PREFETCH_WORKERS = 4
+
+
+def fetch_url(url, timeout=FETCH_TIMEOUT):
+    """Download the bytes at a URL."""
+    request = urllib.request.Request(url, headers={'User-Agent': 'snowpro-core-study-app'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def downscale(data, width=DISPLAY_WIDTH):
+    """Shrink an image to at most `width` pixels wide, keeping its format.
+
+    Images that are already small enough, or that Pillow can't read, are
+    returned unchanged.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= width or image.format not in ('JPEG', 'PNG', 'WEBP'):
+                return data
+            image_format = image.format
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError):
+        return data
+
+    output = io.BytesIO()
+    resized.save(output, format=image_format)
+    return output.getvalue()
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageCache:
+    """Memory + disk cache of downscaled question images, keyed by URL."""
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_disk_bytes=MAX_DISK_BYTES,
+                 max_memory_bytes=MAX_MEMORY_BYTES, width=DISPLAY_WIDTH, fetch=fetch_url):
+        self.width = width
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._fetch = fetch
+
+        # Blobs are stored under their content hash; URL entries point at a blob
+        self._blob_dir = os.path.join(cache_dir, 'blobs')
+        self._url_dir = os.path.join(cache_dir, 'urls')
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._url_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # url -> bytes, most recently used last
+        self._memory_bytes = 0
+        self._in_flight = {}  # url -> Future of a running prefetch
+        self._failed = {}  # url -> time of the last failed fetch
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='image-prefetch')
+
+        # Disk LRU order rebuilt from file access times
+        blobs = []
+        for name in os.listdir(self._blob_dir):
+            stat = os.stat(os.path.join(self._blob_dir, name))
+            blobs.append((stat.st_mtime, name, stat.st_size))
+        self._disk = OrderedDict((name, size) for _, name, size in sorted(blobs))
+        self._disk_bytes = sum(self._disk.values())
+
+    def get(self, url, wait=False):
+        """Return the image bytes for a URL, or None if they aren't cached yet.
+
+        A miss starts fetching the image in the background and returns None
+        straight away, so the caller can show the remote URL meanwhile. With
+        wait=True the fetch is waited on instead.
+        """
+        with self._lock:
+            data = self._memory.get(url)
+            if data is not None:
+                self._memory.move_to_end(url)
+                count('image_memory_hit')
+                return data
+
+        # The disk cache is local, so reading it doesn't hold up the caller
+        data = self._read_disk(url)
+        if data is not None:
+            self._remember(url, data)
+            return data
+
+        with self._lock:
+            data = self._memory.get(url)  # A prefetch may have just finished
+            future = self._start_fetch(url) if data is None else None
+        if future is not None and wait:
+            return future.result()
+        return data
+
+    def prefetch(self, urls):
+        """Start fetching images in the background."""
+        with self._lock:
+            for url in urls:
+                if url and url not in self._memory:
+                    self._start_fetch(url)
+
+    def _start_fetch(self, url):
+        # Called with the lock held; None if the URL failed too recently to retry
+        future = self._in_flight.get(url)
+        if future is None and time.monotonic() - self._failed.get(url, -RETRY_AFTER) >= RETRY_AFTER:
+            future = self._in_flight[url] = self._executor.submit(self._prefetch_one, url)
+        return future
+
+    def _prefetch_one(self, url):
+        try:
+            return self._load(url)
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+    def _load(self, url):
+        data = self._read_disk(url)
+        if data is None:
+            count('image_fetch')
+            try:
+                with span('image_fetch'):
+                    data = downscale(self._fetch(url), self.width)
+            except (OSError, ValueError, http.client.HTTPException):
+                with self._lock:
+                    self._failed[url] = time.monotonic()
+                return None
+            self._write_disk(url, data)
+        self._remember(url, data)
+        return data
+
+    def _url_path(self, url):
+        return os.path.join(self._url_dir, _sha256(url.encode('utf-8')))
+
+    def _read_disk(self, url):
+        try:
+            with open(self._url_path(url)) as f:
+                blob = f.read().strip()
+            blob_path = os.path.join(self._blob_dir, blob)
+            with open(blob_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        # Refresh the blob's position in the LRU order (a prefetch may have just evicted it)
+        try:
+            os.utime(blob_path)
+        except OSError:
+            pass
+        with self._lock:
+            if blob in self._disk:
+                self._disk.move_to_end(blob)
+        return data
+
+    def _write_disk(self, url, data):
+        blob = _sha256(data)
+        blob_path = os.path.join(self._blob_dir, blob)
+        try:
+            if not os.path.exists(blob_path):
+                tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, blob_path)
+            with open(self._url_path(url), 'w') as f:
+                f.write(blob)
+        except OSError:
+            return  # The disk cache is an optimization; serving from memory is fine
+
+        with self._lock:
+            if blob not in self._disk:
+                self._disk[blob] = len(data)
+                self._disk_bytes += len(data)
+            self._disk.move_to_end(blob)
+            evicted = []
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old_blob, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_blob)
+
+        # URL entries pointing at an evicted blob just miss on the next read
+        for old_blob in evicted:
+            try:
+                os.remove(os.path.join(self._blob_dir, old_blob))
+            except OSError:
+                pass
+
+    def _remember(self, url, data):
+        with self._lock:
+            if url in self._memory:
+                return
+            self._memory[url] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
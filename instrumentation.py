@@ -0,0 +1,139 @@
+# Latency instrumentation
+#
+# Timing spans and counters for finding where a rerun's time goes. Spans keep
+# a rolling window of recent durations for p50/p95/p99, and every span and a
+# snapshot of the counters are appended to a JSON-lines file for offline
+# analysis.
+#
+# Collection is off unless the STUDY_APP_PROFILE environment variable is set.
+# When it is off, `timed` hands back the undecorated function, `span` returns
+# a shared no-op context manager and `count` does nothing, so instrumented
+# code pays at most one function call.
+
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+PROFILE_ENV = 'STUDY_APP_PROFILE'
+PROFILE_LOG = 'profile.jsonl'
+
+WINDOW = 2048  # Recent durations kept per span
+FLUSH_EVERY = 256  # Buffered records written to the log at a time
+
+_NULL_SPAN = contextlib.nullcontext()
+
+logger = logging.getLogger(__name__)
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Profiler:
+    """Rolling span timings and counters, exported to a JSON-lines log."""
+
+    def __init__(self, enabled=False, log_path=PROFILE_LOG, window=WINDOW):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._durations = {}  # span name -> deque of recent durations in ns
+        self._span_counts = {}
+        self._counters = {}
+        self._pending = []  # Records not yet written to the log
+
+    def span(self, name):
+        """Context manager timing the code inside it."""
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function (a no-op when disabled)."""
+        def decorate(func):
+            if not self.enabled:
+                return func
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Span(self, span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def record(self, name, duration_ns):
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.window)
+            durations.append(duration_ns)
+            self._span_counts[name] = self._span_counts.get(name, 0) + 1
+            self._pending.append({'time': time.time(), 'span': name, 'ms': duration_ns / 1e6})
+            if len(self._pending) >= FLUSH_EVERY:
+                self._write_pending()
+
+    def span_stats(self):
+        """(span, total calls, p50 ms, p95 ms, p99 ms) over each span's recent window."""
+        with self._lock:
+            windows = {name: np.fromiter(durations, dtype=np.int64) for name, durations in self._durations.items()}
+            counts = dict(self._span_counts)
+        stats = []
+        for name in sorted(windows):
+            p50, p95, p99 = np.percentile(windows[name], [50, 95, 99]) / 1e6
+            stats.append((name, counts[name], p50, p95, p99))
+        return stats
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def flush(self):
+        """Write buffered spans and the current counters to the log."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._pending.append({'time': time.time(), 'counters': dict(self._counters)})
+            self._write_pending()
+
+    def _write_pending(self):
+        # Called with the lock held
+        records, self._pending = self._pending, []
+        try:
+            with open(self.log_path, 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+        except OSError as e:
+            logger.warning("Dropped %d profiling records: %s", len(records), e)
+
+
+profiler = Profiler(enabled=bool(os.environ.get(PROFILE_ENV)))
+atexit.register(profiler.flush)
+
+span = profiler.span
+timed = profiler.timed
+count = profiler.count
@@ -0,0 +1,254 @@
+# Persistent study progress
+#
+# Answers, flags and quiz layouts are kept in a local SQLite database in WAL
+# mode so they survive restarts and browser refreshes. All writes go through a
+# queue to a single background writer thread that commits them in batches, so
+# the submit path never waits on disk I/O and sessions never contend for the
+# write lock. Reads open their own short-lived connection; WAL lets them run
+# alongside the writer.
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+PROGRESS_DB = 'study_progress.db'
+
+# Maximum number of queued writes committed in one transaction
+WRITE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quizzes (
+    quiz_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    num_questions INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS quizzes_user ON quizzes (user_id, started_at);
+
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    quiz_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    qid TEXT NOT NULL,
+    PRIMARY KEY (quiz_id, position)
+);
+
+-- The questions an adaptive quiz may draw from, when it was started on a subset of the bank
+CREATE TABLE IF NOT EXISTS quiz_pool (
+    quiz_id TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    PRIMARY KEY (quiz_id, qid)
+);
+
+CREATE TABLE IF NOT EXISTS answers (
+    user_id TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    quiz_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    selected TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    seconds REAL,
+    answered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_user_qid ON answers (user_id, qid);
+CREATE INDEX IF NOT EXISTS answers_quiz ON answers (quiz_id, position);
+
+-- The user's current flag on a question, for the study history
+CREATE TABLE IF NOT EXISTS flags (
+    user_id TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    flagged INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, qid)
+);
+
+-- Flags as set in each quiz, for resuming it
+CREATE TABLE IF NOT EXISTS quiz_flags (
+    quiz_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    flagged INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (quiz_id, position)
+);
+"""
+
+_INSERT_QUIZ = "INSERT OR REPLACE INTO quizzes VALUES (?, ?, ?, ?, ?, NULL)"
+_FINISH_QUIZ = "UPDATE quizzes SET finished_at = ? WHERE quiz_id = ?"
+_INSERT_QUIZ_QUESTION = "INSERT OR REPLACE INTO quiz_questions VALUES (?, ?, ?)"
+_INSERT_POOL_QUESTION = "INSERT OR IGNORE INTO quiz_pool VALUES (?, ?)"
+_INSERT_ANSWER = "INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+_UPSERT_FLAG = """
+INSERT INTO flags (user_id, qid, flagged, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (user_id, qid) DO UPDATE SET flagged = excluded.flagged, updated_at = excluded.updated_at
+"""
+_UPSERT_QUIZ_FLAG = "INSERT OR REPLACE INTO quiz_flags VALUES (?, ?, ?, ?)"
+
+_STOP = object()
+
+
+class ProgressStore:
+    """SQLite-backed answer history, flags and quiz layouts per user."""
+
+    def __init__(self, path=PROGRESS_DB):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Older databases kept the flag's quiz and position on the per-user row
+            if 'quiz_id' in {column for _, column, *_ in conn.execute("PRAGMA table_info(flags)")}:
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO quiz_flags"
+                                 " SELECT quiz_id, position, flagged, updated_at FROM flags WHERE quiz_id IS NOT NULL")
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="progress-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # --- Writes (queued, never block the caller) ---
+
+    def start_quiz(self, quiz_id, user_id, mode, qids, num_questions, pool_qids=None):
+        self._queue.put((_INSERT_QUIZ, (quiz_id, user_id, mode, num_questions, time.time())))
+        for position, qid in enumerate(qids):
+            self.add_quiz_question(quiz_id, position, qid)
+        for qid in pool_qids or ():
+            self._queue.put((_INSERT_POOL_QUESTION, (quiz_id, qid)))
+
+    def add_quiz_question(self, quiz_id, position, qid):
+        self._queue.put((_INSERT_QUIZ_QUESTION, (quiz_id, position, qid)))
+
+    def finish_quiz(self, quiz_id):
+        self._queue.put((_FINISH_QUIZ, (time.time(), quiz_id)))
+
+    def record_answer(self, user_id, qid, quiz_id, position, selected, correct, seconds=None):
+        self._queue.put((_INSERT_ANSWER, (
+            user_id, qid, quiz_id, position, ','.join(selected), int(correct), seconds, time.time()
+        )))
+
+    def set_flag(self, user_id, qid, quiz_id, position, flagged):
+        now = time.time()
+        self._queue.put((_UPSERT_FLAG, (user_id, qid, int(flagged), now)))
+        self._queue.put((_UPSERT_QUIZ_FLAG, (quiz_id, position, int(flagged), now)))
+
+    def flush(self):
+        """Block until every queued write has been committed."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in batch
+            writes = [item for item in batch if item is not _STOP]
+            try:
+                with conn:
+                    for sql, params in writes:
+                        conn.execute(sql, params)
+            except sqlite3.Error:
+                # The batch was rolled back; retry its writes one at a time so
+                # a single bad write doesn't lose the rest
+                self._write_each(conn, writes)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                conn.close()
+                return
+
+    def _write_each(self, conn, writes):
+        failed = 0
+        error = None
+        for sql, params in writes:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            except sqlite3.Error as e:
+                failed += 1
+                error = e
+        if failed:
+            # Progress is best-effort; a failed write must not kill the writer
+            logger.error("Dropped %d of %d progress writes: %s", failed, len(writes), error)
+
+    # --- Reads ---
+
+    def _read(self, sql, params):
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def latest_unfinished_quiz(self, user_id):
+        """Return (quiz_id, mode, num_questions) of the user's last open quiz, or None."""
+        rows = self._read(
+            "SELECT quiz_id, mode, num_questions FROM quizzes"
+            " WHERE user_id = ? AND finished_at IS NULL ORDER BY started_at DESC LIMIT 1",
+            (user_id,),
+        )
+        return rows[0] if rows else None
+
+    def quiz_started_at(self, quiz_id):
+        """When a quiz was started (seconds since the epoch)."""
+        rows = self._read("SELECT started_at FROM quizzes WHERE quiz_id = ?", (quiz_id,))
+        return rows[0][0]
+
+    def quiz_questions(self, quiz_id):
+        """QIDs of a quiz in question order."""
+        rows = self._read("SELECT qid FROM quiz_questions WHERE quiz_id = ? ORDER BY position", (quiz_id,))
+        return [qid for qid, in rows]
+
+    def quiz_pool(self, quiz_id):
+        """QIDs a quiz was restricted to when it started, or None if it could use the whole bank."""
+        rows = self._read("SELECT qid FROM quiz_pool WHERE quiz_id = ?", (quiz_id,))
+        return [qid for qid, in rows] or None
+
+    def quiz_answers(self, quiz_id):
+        """(position, selected letters, correct) for each answer in a quiz."""
+        rows = self._read(
+            "SELECT position, selected, correct FROM answers WHERE quiz_id = ? ORDER BY position",
+            (quiz_id,),
+        )
+        return [(position, tuple(selected.split(',')) if selected else (), bool(correct))
+                for position, selected, correct in rows]
+
+    def quiz_flags(self, quiz_id):
+        """Positions flagged in a quiz."""
+        rows = self._read("SELECT position FROM quiz_flags WHERE quiz_id = ? AND flagged = 1", (quiz_id,))
+        return {position for position, in rows}
+
+    def user_answers(self, user_id):
+        """(qid, correct, answered_at) for all of a user's answers, oldest first."""
+        rows = self._read(
+            "SELECT qid, correct, answered_at FROM answers WHERE user_id = ? ORDER BY answered_at",
+            (user_id,),
+        )
+        return [(qid, bool(correct), answered_at) for qid, correct, answered_at in rows]
+
+    def user_flags(self, user_id):
+        """QIDs the user currently has flagged."""
+        rows = self._read("SELECT qid FROM flags WHERE user_id = ? AND flagged = 1", (user_id,))
+        return {qid for qid, in rows}
+
+    def all_answers(self):
+        """(user_id, qid, selected letters, correct, seconds) for every answer, oldest first."""
+        rows = self._read("SELECT user_id, qid, selected, correct, seconds FROM answers ORDER BY answered_at", ())
+        return [(user_id, qid, tuple(selected.split(',')) if selected else (), bool(correct), seconds)
+                for user_id, qid, selected, correct, seconds in rows]
@@ -0,0 +1,271 @@
+# Question bank loading and compilation
+#
+# The bank is edited as a CSV, but parsing it (multi-line quoted explanations
+# included) on every cold start is wasted work. `compile_bank()` turns the CSV
+# into an Arrow IPC file with the derived fields already computed, and
+# `read_bank()` memory-maps that file when its recorded source hash still
+# matches the CSV, falling back to the CSV otherwise. `load_questions()` turns
+# the bank into a tuple of immutable Question records that every session shares.
+#
+# Usage: python question_bank.py compile
+
+import argparse
+import hashlib
+import os
+import re
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from exam_blueprint import ExamBlueprint
+
+BANK_CSV = 'all_questions - Sheet1.csv'
+COMPILED_BANK = 'all_questions.arrow'
+
+OPTION_LETTERS = ['A', 'B', 'C', 'D', 'E', 'F']
+
+# Regex pattern to detect documentation URLs
+DOC_URL_PATTERN = re.compile(r'(https?://[^\s,]+)')
+
+# Schema metadata key holding the sha256 of the CSV the file was compiled from
+SOURCE_HASH_KEY = b'source_sha256'
+
+
+def file_sha256(path):
+    """Return the hex sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_bank(data):
+    """Add the derived columns used by the app to a freshly parsed bank."""
+    # Ensure QID column is treated as string
+    data['QID'] = data['QID'].astype(str)
+
+    # Correct answers pre-split into option letters, e.g. "A,C" -> ('A', 'C')
+    data['Correct Letters'] = [
+        tuple(letter.strip() for letter in answer.split(',') if letter.strip())
+        if isinstance(answer, str) else ()
+        for answer in data['CORRECT ANSWER']
+    ]
+
+    # Documentation URLs pulled out of the free-text documentation column
+    data['Doc URLs'] = [
+        tuple(DOC_URL_PATTERN.findall(doc)) if isinstance(doc, str) else ()
+        for doc in data['Snowflake Documentation']
+    ]
+
+    # Explanations are written with literal "\n" markers for line breaks
+    data['EXPLANATION/NOTES'] = data['EXPLANATION/NOTES'].str.replace('\\n', '\n', regex=False)
+
+    # Exam domains as small integer codes (-1 for a missing domain)
+    codes, _ = pd.factorize(data['Exam Domain'], sort=True)
+    data['Domain Code'] = codes.astype('int8')
+
+    return data
+
+
+class Question(NamedTuple):
+    """Immutable record for one question in the bank."""
+    qid: str
+    text: str
+    options: tuple  # Option text per letter in OPTION_LETTERS, None if unused
+    correct_letters: tuple
+    explanation: str | None
+    documentation: str | None
+    doc_urls: tuple
+    doc_links: tuple  # Markdown links for doc_urls
+    image_url: str | None
+    domain: str | None
+    domain_code: int
+
+    def option(self, letter):
+        """Return the option text for an answer letter."""
+        return self.options[OPTION_LETTERS.index(letter)]
+
+    @property
+    def option_letters(self):
+        """Letters of the options this question actually uses."""
+        return [letter for letter, option in zip(OPTION_LETTERS, self.options) if option is not None]
+
+    @property
+    def correct_answers(self):
+        """Option texts of the correct answers."""
+        return [self.option(letter) for letter in self.correct_letters]
+
+
+def doc_link_markdown(doc_urls):
+    """Format doc URLs as Snowflake Documentation(1), Snowflake Documentation(2), etc."""
+    return tuple(f"[Snowflake Documentation({i+1})]({link})" for i, link in enumerate(doc_urls))
+
+
+def _none_if_missing(value):
+    return value if pd.notna(value) else None
+
+
+def build_questions(data):
+    """Turn a prepared bank DataFrame into a tuple of Question records."""
+    options = zip(*([_none_if_missing(option) for option in data[letter]] for letter in OPTION_LETTERS))
+    return tuple(
+        Question(qid, text, option_row, correct_letters, _none_if_missing(explanation),
+                 _none_if_missing(documentation), doc_urls, doc_link_markdown(doc_urls),
+                 _none_if_missing(image_url),
+                 _none_if_missing(domain), int(domain_code))
+        for qid, text, option_row, correct_letters, explanation, documentation, doc_urls,
+        image_url, domain, domain_code in zip(
+            data['QID'], data['QUESTION'], options, data['Correct Letters'],
+            data['EXPLANATION/NOTES'], data['Snowflake Documentation'], data['Doc URLs'],
+            data['Image URL'], data['Exam Domain'], data['Domain Code'],
+        )
+    )
+
+
+def domain_index(questions):
+    """Return the exam domain labels and each question's index into them.
+
+    Labels are ordered by domain code, with a trailing 'N/A' label for
+    questions that have no domain.
+    """
+    num_domains = max((question.domain_code for question in questions), default=-1) + 1
+    labels = ['N/A'] * (num_domains + 1)
+    for question in questions:
+        if question.domain_code >= 0:
+            labels[question.domain_code] = question.domain
+
+    codes = np.fromiter((question.domain_code for question in questions), dtype=np.int8, count=len(questions))
+    codes[codes < 0] = num_domains
+
+    return labels, codes
+
+
+class QuestionBank:
+    """Read-only question records plus the lookups built over them.
+
+    version numbers the snapshots a BankWatcher loads as the CSV changes.
+    """
+    __slots__ = ('questions', 'domain_labels', 'domain_codes', 'qid_lookup', 'blueprint', 'version', '__weakref__')
+
+    def __init__(self, questions, version=0):
+        self.questions = questions
+        self.version = version
+        self.domain_labels, self.domain_codes = domain_index(questions)
+        self.qid_lookup = {question.qid: index for index, question in enumerate(questions)}
+        self.blueprint = ExamBlueprint(self.domain_labels, self.domain_codes)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+
+def temp_path(path):
+    """A temporary path next to path, unique to this process and thread."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def compile_bank(csv_path=BANK_CSV, compiled_path=COMPILED_BANK):
+    """Parse the CSV bank and write it out as a compiled Arrow file."""
+    source_hash = file_sha256(csv_path)
+    data = prepare_bank(pd.read_csv(csv_path))
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_HASH_KEY] = source_hash.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # Write to a temporary file first so readers never see a partial bank
+    tmp_path = temp_path(compiled_path)
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, compiled_path)
+
+    return data
+
+
+def load_compiled_bank(compiled_path=COMPILED_BANK, source_hash=None):
+    """Load a compiled bank, or return None if it is missing, unreadable or stale."""
+    if not os.path.exists(compiled_path):
+        return None
+
+    try:
+        with pa.memory_map(compiled_path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid, KeyError):
+        return None  # Truncated or corrupt; read_bank recompiles it from the CSV
+
+    recorded_hash = (table.schema.metadata or {}).get(SOURCE_HASH_KEY, b'').decode()
+    if source_hash is not None and recorded_hash != source_hash:
+        return None
+
+    data = table.to_pandas()
+
+    # Arrow hands list columns back as numpy arrays
+    data['Correct Letters'] = data['Correct Letters'].map(tuple)
+    data['Doc URLs'] = data['Doc URLs'].map(tuple)
+
+    return data
+
+
+def compiled_path_for(csv_path):
+    """Compiled bank path for a CSV: COMPILED_BANK for the app's bank, None for any other.
+
+    Other CSVs are parsed on every load rather than leaving compiled files next to them.
+    """
+    return COMPILED_BANK if os.path.abspath(csv_path) == os.path.abspath(BANK_CSV) else None
+
+
+def read_bank(csv_path=BANK_CSV, compiled_path=COMPILED_BANK):
+    """Load the question bank, preferring a fresh compiled file over the CSV.
+
+    With compiled_path None the CSV is parsed without compiling it.
+    """
+    if compiled_path is None:
+        return prepare_bank(pd.read_csv(csv_path))
+
+    source_hash = file_sha256(csv_path)
+    data = load_compiled_bank(compiled_path, source_hash)
+    if data is not None:
+        return data
+
+    # Missing or stale compiled file: parse the CSV and try to refresh it
+    try:
+        return compile_bank(csv_path, compiled_path)
+    except OSError:
+        return prepare_bank(pd.read_csv(csv_path))
+
+
+def load_questions(csv_path=BANK_CSV, compiled_path=COMPILED_BANK):
+    """Load the question bank as a tuple of Question records."""
+    return build_questions(read_bank(csv_path, compiled_path))
+
+
+def load_question_bank(csv_path=BANK_CSV, compiled_path=COMPILED_BANK, version=0):
+    """Load the question bank with its domain and QID lookups."""
+    return QuestionBank(load_questions(csv_path, compiled_path), version)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Question bank tools for the SnowPro Core Study App.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = subparsers.add_parser('compile', help="Compile the CSV bank into an Arrow file.")
+    compile_parser.add_argument('--csv', default=BANK_CSV, help="Path to the question bank CSV.")
+    compile_parser.add_argument('--out', default=COMPILED_BANK, help="Path of the compiled bank to write.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile':
+        data = compile_bank(args.csv, args.out)
+        print(f"Compiled {len(data)} questions from '{args.csv}' into '{args.out}'.")
+
+
+if __name__ == '__main__':
+    main()
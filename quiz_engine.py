@@ -0,0 +1,386 @@
+# Headless quiz engine
+#
+# All of a quiz's grading, navigation, flagging, scoring and review state,
+# with no Streamlit in sight. The app keeps one QuizEngine per session and
+# renders from it; bench_quiz_engine.py drives thousands of them directly.
+
+import random
+import time
+import uuid
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from adaptive_sampler import StudyHistory, build_sampler, domain_factors
+from instrumentation import count, timed
+
+# Quiz modes: uniform random sampling, weighted by the user's study history,
+# or a timed mock exam following the exam's domain weights
+QUIZ_MODES = ["Random", "Adaptive", "Mock Exam"]
+
+# Mock exam time limit, at the real exam's pace (115 minutes for 100 questions)
+MOCK_EXAM_SECONDS_PER_QUESTION = 69
+
+# Per-question answer state, packed as bit flags into one byte per quiz question
+SUBMITTED = 1
+ANSWERED_CORRECTLY = 2
+FLAGGED = 4
+
+# Columns of the quiz review table
+REVIEW_COLUMNS = [
+    'Question', 'Your Answer', 'Correct Answer', 'Correct?',
+    'Explanation', 'Snowflake Documentation', 'Flagged', 'Exam Domain', 'Seconds Spent'
+]
+
+
+class QuizEngine:
+    """State and rules for one user's quiz over a shared QuestionBank.
+
+    The optional study history, progress store and cohort analytics are kept
+    up to date as answers and flags come in.
+    """
+
+    def __init__(self, bank, quiz_id, mode, num_questions, selected_questions,
+                 history=None, progress=None, user_id=None, rng=random, analytics=None):
+        self.bank = bank
+        self.quiz_id = quiz_id
+        self.mode = mode
+        self.num_questions = num_questions
+        self.selected_questions = selected_questions  # Bank indices, in quiz order
+        self.history = history
+        self.progress = progress
+        self.user_id = user_id
+        self.rng = rng
+        self.analytics = analytics
+
+        self.current = 0
+        self.score = 0
+        self.answered = 0  # Track how many questions were answered
+
+        # Compact answer state: flags per question, plus selections and option order once seen
+        self.answer_state = bytearray(num_questions)
+        self.selected_answers = {}
+        self.shuffled_options = {}
+        self.shown_at = {}
+
+        # Seconds spent on each question across all visits, and the question on screen
+        self.dwell = array('f', bytes(4 * num_questions))
+        self._viewing = None
+        self._viewing_since = 0.0
+
+        # Mock exams end at a fixed time, whatever the user is doing
+        self.deadline = None
+
+        # Questions visited so far, keyed by QID, in the order they were first seen
+        self.reviewed = {}
+
+        # Running per-domain counters, indexed by domain, updated on each submit
+        num_domains = len(bank.domain_labels)
+        self.domain_correct = np.zeros(num_domains, dtype=np.int32)
+        self.domain_answered = np.zeros(num_domains, dtype=np.int32)
+        self.domain_total = np.bincount(bank.domain_codes[selected_questions], minlength=num_domains)
+
+        self.sampler = None
+
+    # --- Starting and resuming ---
+
+    @classmethod
+    def start(cls, bank, num_questions, mode="Random", history=None, progress=None, user_id=None, rng=random,
+              pool=None, analytics=None):
+        """Start a new quiz of num_questions questions.
+
+        pool optionally restricts the quiz to a list of bank indices (e.g. search results).
+        """
+        if pool is None:
+            pool = range(len(bank))
+        num_questions = min(int(num_questions), len(pool))
+        if mode == "Adaptive":
+            # Adaptive quizzes draw each question when it is reached, so weights
+            # reflect the answers given so far
+            selected_questions = array('H')
+        elif mode == "Mock Exam":
+            # Questions without a blueprint domain are left out of mock exams
+            selected_questions = array('H', bank.blueprint.sample(num_questions, rng, pool))
+            num_questions = len(selected_questions)
+        else:
+            selected_questions = array('H', rng.sample(pool, num_questions))
+
+        quiz = cls(bank, uuid.uuid4().hex, mode, num_questions, selected_questions,
+                   history, progress, user_id, rng, analytics)
+        if progress is not None:
+            # Adaptive quizzes keep drawing from their pool, so it is saved for resuming
+            pool_qids = [bank[index].qid for index in pool] if mode == "Adaptive" and len(pool) < len(bank) else None
+            progress.start_quiz(quiz.quiz_id, user_id, mode,
+                                [bank[index].qid for index in selected_questions], num_questions, pool_qids)
+
+        if mode == "Mock Exam":
+            quiz.deadline = time.time() + num_questions * MOCK_EXAM_SECONDS_PER_QUESTION
+
+        if mode == "Adaptive":
+            quiz._start_sampler(pool)
+            quiz._draw_next()
+        return quiz
+
+    @classmethod
+    def resume(cls, bank, quiz_id, mode, num_questions, history=None, progress=None, user_id=None, rng=random,
+               analytics=None):
+        """Rebuild a quiz saved in the progress store."""
+        # Questions removed from the bank since the quiz started are skipped
+        selected_questions = array('H')
+        positions = {}
+        for position, qid in enumerate(progress.quiz_questions(quiz_id)):
+            if qid in bank.qid_lookup:
+                positions[position] = len(selected_questions)
+                selected_questions.append(bank.qid_lookup[qid])
+
+        if mode != "Adaptive":
+            num_questions = len(selected_questions)
+        quiz = cls(bank, quiz_id, mode, num_questions, selected_questions, history, progress, user_id, rng, analytics)
+
+        # Replay submitted answers and flags
+        for position, selected, correct in progress.quiz_answers(quiz_id):
+            question_number = positions.get(position)
+            if question_number is not None:
+                quiz._grade(question_number, selected, correct)
+                quiz.reviewed.setdefault(quiz.question(question_number).qid, question_number)
+        for position in progress.quiz_flags(quiz_id):
+            if position in positions:
+                quiz.answer_state[positions[position]] |= FLAGGED
+
+        # Pick up at the first unanswered question
+        quiz.current = next(
+            (number for number in range(len(selected_questions)) if not quiz.answer_state[number] & SUBMITTED),
+            len(selected_questions)
+        )
+
+        if mode == "Mock Exam":
+            # The clock kept running while the quiz was away
+            quiz.deadline = progress.quiz_started_at(quiz_id) + num_questions * MOCK_EXAM_SECONDS_PER_QUESTION
+            if quiz.time_expired:
+                quiz.exit()
+
+        if mode == "Adaptive":
+            # Questions removed from the bank since are left out of the pool too
+            pool_qids = progress.quiz_pool(quiz_id)
+            pool = None if pool_qids is None else [bank.qid_lookup[qid] for qid in pool_qids if qid in bank.qid_lookup]
+            quiz._start_sampler(pool)
+            for index in selected_questions:
+                quiz.sampler.remove(index)
+            if quiz.current == len(selected_questions) < num_questions:
+                quiz._draw_next()
+        return quiz
+
+    def _start_sampler(self, pool=None):
+        # Adaptive quizzes draw from the whole bank, or only from the pool they were started on
+        if self.history is None:
+            self.history = StudyHistory()
+        self.sampler = build_sampler(self.bank.questions, self.bank.domain_codes, self.bank.domain_labels, self.history)
+        if pool is not None and len(pool) < len(self.bank):
+            for index in set(range(len(self.bank))).difference(pool):
+                self.sampler.remove(index)
+
+    def _draw_next(self):
+        # Draw the next question of an adaptive quiz from the weighted sampler
+        index = self.sampler.draw(self.rng)
+        if index is None:
+            # Every question has been drawn: the quiz ends with the ones asked so far
+            self.num_questions = len(self.selected_questions)
+            return
+        self.sampler.remove(index)  # Sample without replacement
+        self.selected_questions.append(index)
+        self.domain_total[self.bank.domain_codes[index]] += 1
+        if self.progress is not None:
+            self.progress.add_quiz_question(self.quiz_id, len(self.selected_questions) - 1, self.bank[index].qid)
+
+    # --- Questions ---
+
+    @property
+    def finished(self):
+        return self.current >= self.num_questions or self.time_expired
+
+    @property
+    def time_expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def seconds_left(self):
+        """Seconds until a mock exam's deadline (None if the quiz isn't timed)."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def question(self, question_number):
+        return self.bank[self.selected_questions[question_number]]
+
+    @timed('shuffle_options')
+    def options(self, question_number):
+        """Answer letters in this quiz's shuffled order (shuffled once per question)."""
+        shuffled = self.shuffled_options.get(question_number)
+        if shuffled is None:
+            letters = self.question(question_number).option_letters
+            self.rng.shuffle(letters)
+            shuffled = self.shuffled_options[question_number] = ''.join(letters)
+        return list(shuffled)
+
+    def mark_shown(self, question_number):
+        """Record that a question was displayed, for timings and the review."""
+        now = time.time()
+        self.shown_at.setdefault(question_number, now)
+        self.reviewed.setdefault(self.question(question_number).qid, question_number)
+        self._update_dwell(now)
+        self._viewing = question_number
+
+    def _update_dwell(self, now):
+        # Charge the time since the last update to the question on screen
+        if self._viewing is not None:
+            self.dwell[self._viewing] += now - self._viewing_since
+        self._viewing_since = now
+
+    def upcoming(self, question_number, count):
+        """Questions already selected after question_number, up to count of them."""
+        return [self.bank[index] for index in self.selected_questions[question_number + 1:question_number + 1 + count]]
+
+    # --- Answer state ---
+
+    def is_submitted(self, question_number):
+        return bool(self.answer_state[question_number] & SUBMITTED)
+
+    def is_correct(self, question_number):
+        return bool(self.answer_state[question_number] & ANSWERED_CORRECTLY)
+
+    def is_flagged(self, question_number):
+        return bool(self.answer_state[question_number] & FLAGGED)
+
+    def selected(self, question_number):
+        return self.selected_answers.get(question_number)
+
+    def answer(self, question_number, selected):
+        """Submit answer letters for a question and return whether they were correct.
+
+        Raises ValueError if the question was already submitted or the wrong
+        number of options was selected.
+        """
+        if self.is_submitted(question_number):
+            raise ValueError(f"Question {question_number + 1} was already submitted.")
+        if self.time_expired:
+            raise ValueError("Time is up.")
+        question = self.question(question_number)
+        num_correct = len(question.correct_letters)
+        if len(selected) != num_correct:
+            raise ValueError(f"Please select exactly {num_correct} option(s).")
+
+        selected = tuple(selected)
+        correct = set(selected) == set(question.correct_letters)
+        domain = self._grade(question_number, selected, correct)
+
+        self._update_dwell(time.time())
+        seconds = float(self.dwell[question_number]) if question_number in self.shown_at else None
+
+        # Save the answer (queued to the background writer, no disk I/O here)
+        if self.progress is not None:
+            self.progress.record_answer(self.user_id, question.qid, self.quiz_id, question_number,
+                                        selected, correct, seconds)
+
+        # Count it towards the cohort's per-question statistics
+        if self.analytics is not None:
+            self.analytics.record(self.user_id, question.qid, selected, correct, seconds)
+
+        # Record the answer in the study history and reweight its domain
+        if self.history is not None:
+            self.history.record_answer(question.qid, self.bank.domain_labels[domain], correct)
+            if self.sampler is not None:
+                factors = domain_factors(self.history.domain_scores(self.bank.domain_labels))
+                self.sampler.set_domain_factor(domain, factors[domain])
+
+        return correct
+
+    def _grade(self, question_number, selected, correct):
+        domain = self.bank.domain_codes[self.selected_questions[question_number]]
+        self.answer_state[question_number] |= SUBMITTED | (ANSWERED_CORRECTLY if correct else 0)
+        self.selected_answers[question_number] = selected
+        self.answered += 1
+        self.domain_answered[domain] += 1
+        if correct:
+            self.score += 1
+            self.domain_correct[domain] += 1
+        return domain
+
+    def flag(self, question_number, flagged):
+        """Set a question's flag."""
+        if flagged == self.is_flagged(question_number):
+            return
+        if flagged:
+            self.answer_state[question_number] |= FLAGGED
+        else:
+            self.answer_state[question_number] &= ~FLAGGED
+
+        qid = self.question(question_number).qid
+        if self.history is not None:
+            self.history.set_flag(qid, flagged)
+        if self.progress is not None:
+            self.progress.set_flag(self.user_id, qid, self.quiz_id, question_number, flagged)
+
+    # --- Navigation ---
+
+    def next(self):
+        self.current += 1
+        if self.sampler is not None and self.current == len(self.selected_questions) < self.num_questions:
+            self._draw_next()
+
+    def previous(self):
+        self.current -= 1
+
+    def exit(self):
+        """End the quiz and go to the score."""
+        self._update_dwell(time.time())
+        self._viewing = None
+        self.current = self.num_questions
+        self.close()
+
+    def close(self):
+        """Mark the quiz finished in the progress store, so it isn't offered for resuming."""
+        if self.progress is not None:
+            self.progress.finish_quiz(self.quiz_id)
+
+    # --- Scoring and review ---
+
+    @property
+    def percentage(self):
+        return self.score / self.answered * 100 if self.answered else 0.0
+
+    def domain_breakdown(self):
+        """(domain label, correct, answered, total) for each domain with questions in the quiz."""
+        in_quiz = np.flatnonzero(self.domain_total)
+        return [(self.bank.domain_labels[domain], int(self.domain_correct[domain]), int(self.domain_answered[domain]),
+                 int(self.domain_total[domain]))
+                for domain in in_quiz]
+
+    def review_row(self, question_number):
+        """The quiz review row for one question."""
+        question = self.question(question_number)
+        selected = self.selected_answers.get(question_number)
+        return {
+            'Question': question.text,
+            'Your Answer': ', '.join(question.option(letter) for letter in selected) if selected else 'N/A',
+            'Correct Answer': ', '.join(question.correct_answers),
+            'Correct?': 'Yes' if self.is_correct(question_number) else 'No',
+            'Explanation': question.explanation or 'N/A',
+            'Snowflake Documentation': ', '.join(question.doc_urls),
+            'Flagged': self.is_flagged(question_number),
+            'Exam Domain': question.domain or 'N/A',
+            'Seconds Spent': round(float(self.dwell[question_number]))
+        }
+
+    def review_rows(self, flagged_only=False):
+        """Yield review rows for every question visited so far."""
+        for question_number in self.reviewed.values():
+            if flagged_only and not self.is_flagged(question_number):
+                continue
+            yield self.review_row(question_number)
+
+    @timed('review_table')
+    def review_dataframe(self, flagged_only=False):
+        """Build the quiz review DataFrame with optional filtering for flagged questions."""
+        count('dataframe')
+        if not self.reviewed:
+            return pd.DataFrame()
+        return pd.DataFrame(list(self.review_rows(flagged_only)), columns=REVIEW_COLUMNS)
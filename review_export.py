@@ -0,0 +1,123 @@
+# Quiz review export
+#
+# Writes the quiz review rows out as CSV or Parquet in fixed-size chunks, so
+# an export never builds a DataFrame copy of the review. The chunks are
+# joined into one bytes object at the end: Streamlit's download_button reads
+# the whole file into memory before serving it, so there is nothing to gain
+# from streaming them further.
+
+import csv
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Rows written per CSV chunk / Parquet row group
+EXPORT_CHUNK_SIZE = 200
+
+
+def filter_review_rows(rows, flagged_only=False, incorrect_only=False):
+    """Yield the review rows that pass the flagged/incorrect filters."""
+    for row in rows:
+        if flagged_only and not row['Flagged']:
+            continue
+        if incorrect_only and row['Correct?'] == 'Yes':
+            continue
+        yield row
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv_chunks(rows, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the review as UTF-8 CSV bytes, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only, if there were no rows at all
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back out in pieces.
+
+    The Parquet writer records file offsets in the footer, so tell() has to
+    keep counting across drains.
+    """
+
+    def __init__(self):
+        self._pieces = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._pieces)
+        self._pieces.clear()
+        return data
+
+
+def iter_parquet_chunks(rows, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the review as Parquet bytes, one row group at a time."""
+    sink = _ChunkSink()
+    writer = None
+
+    for chunk in _chunks(rows, chunk_size):
+        data = {column: [row[column] for row in chunk] for column in columns}
+        if writer is None:
+            batch = pa.RecordBatch.from_pydict(data)
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), batch.schema)
+        else:
+            batch = pa.RecordBatch.from_pydict(data, schema=writer.schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+
+    if writer is None:
+        # No rows: still produce a valid (empty) Parquet file
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    writer.close()
+    yield sink.drain()
+
+
+# Export format -> (file extension, MIME type, chunk generator)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv', iter_csv_chunks),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', iter_parquet_chunks),
+}
+
+
+def export_review(review_rows, columns, export_format='CSV', flagged_only=False, incorrect_only=False):
+    """Return the filtered review encoded in the given export format.
+
+    review_rows is called for a fresh iterable of rows on every export, so the
+    same export can be generated more than once.
+    """
+    _, _, iter_chunks = EXPORT_FORMATS[export_format]
+    rows = filter_review_rows(review_rows(), flagged_only, incorrect_only)
+    return b''.join(iter_chunks(rows, columns))
@@ -0,0 +1,105 @@
+# Full-text question search
+#
+# An inverted index over each question's text, options, explanation and
+# documentation URLs, ranked with BM25. Field weights are folded into the
+# term frequencies (BM25F style) and every term's per-document score is
+# precomputed when the index is built, so a query is a few numpy additions.
+# Query terms ending in '*' match as prefixes; a term that isn't in the index
+# at all also falls back to prefix matching, so partly typed words still hit.
+
+import bisect
+import re
+
+import numpy as np
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Relative weight of each part of a question
+QUESTION_WEIGHT = 2.0
+OPTION_WEIGHT = 1.0
+EXPLANATION_WEIGHT = 1.0
+DOC_URL_WEIGHT = 0.5
+
+# Most index terms a single prefix expands to (the most common ones win)
+MAX_PREFIX_TERMS = 64
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9_]+')
+QUERY_TOKEN_PATTERN = re.compile(r'[a-z0-9_]+\*?')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """BM25 inverted index over a tuple of Question records."""
+
+    def __init__(self, questions):
+        self.size = len(questions)
+
+        # term -> {doc: weighted term frequency}
+        postings = {}
+        doc_lengths = np.zeros(self.size)
+        for doc, question in enumerate(questions):
+            fields = [(question.text, QUESTION_WEIGHT), (question.explanation, EXPLANATION_WEIGHT)]
+            fields += [(option, OPTION_WEIGHT) for option in question.options if option]
+            fields += [(url, DOC_URL_WEIGHT) for url in question.doc_urls]
+            for text, weight in fields:
+                for term in tokenize(text):
+                    frequencies = postings.setdefault(term, {})
+                    frequencies[doc] = frequencies.get(doc, 0.0) + weight
+                    doc_lengths[doc] += weight
+
+        average_length = doc_lengths.mean() if self.size else 0.0
+        length_norm = K1 * (1 - B + B * doc_lengths / average_length) if self.size else doc_lengths
+
+        # Precompute each term's BM25 score for every document it occurs in
+        self.terms = sorted(postings)
+        self._postings = {}
+        self._document_frequency = {}
+        for term in self.terms:
+            docs = np.fromiter(postings[term].keys(), dtype=np.int32)
+            frequencies = np.fromiter(postings[term].values(), dtype=float)
+            idf = np.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores = idf * frequencies * (K1 + 1) / (frequencies + length_norm[docs])
+            self._postings[term] = (docs, scores)
+            self._document_frequency[term] = len(docs)
+
+    def expand_prefix(self, prefix):
+        """Index terms starting with prefix, most common first."""
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        matches = self.terms[start:end]
+        if len(matches) > MAX_PREFIX_TERMS:
+            matches = sorted(matches, key=self._document_frequency.get, reverse=True)[:MAX_PREFIX_TERMS]
+        return matches
+
+    def search(self, query, limit=None):
+        """Return (question index, score) pairs for a query, best first."""
+        scores = np.zeros(self.size)
+        matched = np.zeros(self.size, dtype=bool)
+
+        for token in QUERY_TOKEN_PATTERN.findall(query.lower()):
+            if token.endswith('*'):
+                terms = self.expand_prefix(token[:-1])
+            elif token in self._postings:
+                terms = [token]
+            else:
+                terms = self.expand_prefix(token)
+
+            # A prefix scores each document by its best matching term, so
+            # prefixes with many expansions don't swamp exact terms
+            token_scores = np.zeros(self.size)
+            for term in terms:
+                docs, term_scores = self._postings[term]
+                token_scores[docs] = np.maximum(token_scores[docs], term_scores)
+                matched[docs] = True
+            scores += token_scores
+
+        results = np.flatnonzero(matched)
+        order = np.argsort(-scores[results], kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [(int(results[i]), float(scores[results[i]])) for i in order]
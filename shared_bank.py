@@ -0,0 +1,219 @@
+# Shared-memory question bank
+#
+# For serving from several processes: one loader process parses the bank and
+# publishes it as a single flat file of fixed-width columns plus a UTF-8
+# string arena. Worker processes memory-map that file read-only, so every
+# process shares the same physical pages (put the file under /dev/shm to keep
+# it off disk entirely). Nothing is copied when attaching; a Question record
+# is decoded from the arena only when it is asked for.
+#
+# File layout (all sections 8-byte aligned, offsets relative to the first):
+#   magic, header length (uint64), JSON header
+#   spans         uint32 (questions, fields, 2)  offset/length of each string in the arena
+#   domain codes  int8 (questions,)              QuestionBank.domain_codes
+#   arena         bytes
+#
+# Usage: python shared_bank.py publish [--out PATH] [--watch]
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import Sequence
+from functools import partial
+
+import numpy as np
+
+from bank_lint import lint_cache_for, load_checked_bank
+from bank_watcher import BankWatcher
+from exam_blueprint import ExamBlueprint
+from question_bank import BANK_CSV, OPTION_LETTERS, Question, compiled_path_for, doc_link_markdown, temp_path
+
+SHARED_BANK = 'all_questions.qbank'
+
+MAGIC = b'SPQBANK1'
+_PREFIX = struct.Struct('<8sQ')
+
+# String fields stored per question, in span order
+FIELDS = ('qid', 'text', *OPTION_LETTERS, 'correct_letters', 'explanation', 'documentation',
+          'doc_urls', 'image_url', 'domain')
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+MISSING = 0xFFFFFFFF  # Span length marking a None value
+
+URL_SEPARATOR = '\n'
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _field_values(question):
+    return (question.qid, question.text, *question.options, ''.join(question.correct_letters),
+            question.explanation, question.documentation, URL_SEPARATOR.join(question.doc_urls),
+            question.image_url, question.domain)
+
+
+def publish_bank(bank, path=SHARED_BANK):
+    """Write a QuestionBank out as a shared bank file, replacing any previous one atomically."""
+    count = len(bank)
+    spans = np.zeros((count, len(FIELDS), 2), dtype=np.uint32)
+    arena = bytearray()
+    for row, question in enumerate(bank.questions):
+        for column, value in enumerate(_field_values(question)):
+            if value is None:
+                spans[row, column] = (0, MISSING)
+                continue
+            data = value.encode('utf-8')
+            spans[row, column] = (len(arena), len(data))
+            arena += data
+
+    header = {
+        'count': count,
+        'fields': FIELDS,
+        'domain_labels': bank.domain_labels,
+        'sections': {},
+    }
+    sections = [('spans', spans.tobytes()), ('domain_codes', bank.domain_codes.tobytes()), ('arena', bytes(arena))]
+    offset = 0
+    for name, data in sections:
+        header['sections'][name] = [offset, len(data)]
+        offset = _align(offset + len(data))
+    header_bytes = json.dumps(header).encode()
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        for name, data in sections:
+            f.seek(data_start + header['sections'][name][0])
+            f.write(data)
+        f.truncate(data_start + offset)
+    # Workers that already mapped the old file keep reading it until they let go
+    os.replace(tmp_path, path)
+
+
+class SharedQuestions(Sequence):
+    """Read-only sequence of Question records decoded on access from a shared bank."""
+
+    def __init__(self, spans, arena, domain_labels):
+        self._spans = spans
+        self._arena = arena
+        self._domain_labels = domain_labels
+
+    def __len__(self):
+        return len(self._spans)
+
+    def field(self, index, name):
+        """One string field of a question, without decoding the rest."""
+        offset, length = self._spans[index, _FIELD_INDEX[name]]
+        if length == MISSING:
+            return None
+        return str(self._arena[offset:offset + length], 'utf-8')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        arena = self._arena
+        values = [
+            None if length == MISSING else str(arena[offset:offset + length], 'utf-8')
+            for offset, length in self._spans[index].tolist()
+        ]
+        qid, text, *rest = values
+        options = tuple(rest[:len(OPTION_LETTERS)])
+        correct_letters, explanation, documentation, doc_urls, image_url, domain = rest[len(OPTION_LETTERS):]
+        doc_urls = tuple(doc_urls.split(URL_SEPARATOR)) if doc_urls else ()
+        domain_code = self._domain_labels.index(domain) if domain is not None else -1
+        return Question(qid, text, options, tuple(correct_letters), explanation, documentation,
+                        doc_urls, doc_link_markdown(doc_urls), image_url, domain, domain_code)
+
+
+class SharedQuestionBank:
+    """A QuestionBank backed by a memory-mapped shared bank file.
+
+    Offers the same attributes as QuestionBank, so quizzes, sampling and the
+    app work with either.
+    """
+    __slots__ = ('questions', 'domain_labels', 'domain_codes', 'qid_lookup', 'blueprint', 'version',
+                 '_mmap', '__weakref__')
+
+    def __init__(self, path=SHARED_BANK, version=0):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = _PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a shared question bank")
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_length])
+        if tuple(header['fields']) != FIELDS:
+            raise ValueError(f"'{path}' was published with different fields; publish it again")
+
+        count = header['count']
+        data_start = _align(_PREFIX.size + header_length)
+        sections = {name: data_start + offset for name, (offset, _) in header['sections'].items()}
+        buffer = memoryview(self._mmap)
+        spans = np.frombuffer(buffer, dtype=np.uint32, count=count * len(FIELDS) * 2,
+                              offset=sections['spans']).reshape(count, len(FIELDS), 2)
+        arena = buffer[sections['arena']:sections['arena'] + header['sections']['arena'][1]]
+
+        self.version = version
+        self.domain_labels = header['domain_labels']
+        self.domain_codes = np.frombuffer(buffer, dtype=np.int8, count=count, offset=sections['domain_codes'])
+        self.questions = SharedQuestions(spans, arena, self.domain_labels)
+        self.qid_lookup = {self.questions.field(index, 'qid'): index for index in range(count)}
+        self.blueprint = ExamBlueprint(self.domain_labels, self.domain_codes)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+
+def attach_shared_bank(path=SHARED_BANK, version=0):
+    """Map a published shared bank file."""
+    return SharedQuestionBank(path, version)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish the question bank for multi-process serving.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish_parser = subparsers.add_parser('publish', help="Parse the CSV bank and publish it as a shared bank file.")
+    publish_parser.add_argument('--csv', default=BANK_CSV, help="Path to the question bank CSV.")
+    publish_parser.add_argument('--out', default=SHARED_BANK,
+                                help="Path of the shared bank file (e.g. under /dev/shm).")
+    publish_parser.add_argument('--watch', action='store_true',
+                                help="Keep running and republish whenever the CSV changes.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        load = partial(load_checked_bank, args.csv, compiled_path_for(args.csv),
+                       cache_path=lint_cache_for(args.csv))
+        if not args.watch:
+            bank = load()
+            publish_bank(bank, args.out)
+            print(f"Published {len(bank)} questions to '{args.out}'.")
+            return
+
+        watcher = BankWatcher(args.csv, load)
+        published = None
+        try:
+            while True:
+                if watcher.current is not published:
+                    published = watcher.current
+                    publish_bank(published, args.out)
+                    print(f"Published version {published.version} ({len(published)} questions) to '{args.out}'.")
+                time.sleep(watcher.poll_interval)
+        except KeyboardInterrupt:
+            watcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,153 +2,219 @@
 
 import streamlit as st
 import pandas as pd
-import random
-import re
+from functools import partial
+import os
+import uuid
+
+from adaptive_sampler import StudyHistory
+from bank_watcher import BankWatcher
+from cohort_analytics import CohortStats
+from dedupe import cluster_keys, load_canonical_ids, one_per_cluster
+from image_cache import ImageCache
+from instrumentation import PROFILE_ENV, count, profiler, span, timed
+from progress_store import ProgressStore
+from quiz_engine import MOCK_EXAM_SECONDS_PER_QUESTION, QUIZ_MODES, REVIEW_COLUMNS, QuizEngine
+from review_export import EXPORT_FORMATS, export_review
+from search_index import SearchIndex
+from shared_bank import attach_shared_bank
 
 st.set_page_config(
     page_title="SnowPro Core Study App",
     page_icon="❄️",
 )
 
-# Load questions from CSV
-@st.cache_data
+# Load questions from the compiled bank (falls back to parsing the CSV)
+# The records are read-only, so a single copy is shared by every session.
+# The watcher reloads the bank in the background when the CSV changes.
+# With STUDY_APP_SHARED_BANK set, the bank is instead mapped from a file that
+# `python shared_bank.py publish --watch` keeps up to date, shared by every
+# server process.
+@st.cache_resource
+def load_bank_watcher():
+    shared_path = os.environ.get('STUDY_APP_SHARED_BANK')
+    if shared_path:
+        return BankWatcher(shared_path, partial(attach_shared_bank, shared_path))
+    return BankWatcher()
+
+# The current bank snapshot (running quizzes keep the snapshot they started on)
+@timed('load_data')
 def load_data():
-    file_path = 'all_questions - Sheet1.csv'  # Relative file path
-    data = pd.read_csv(file_path)
+    return load_bank_watcher().current
 
-    # Ensure QID column is treated as string
-    data['QID'] = data['QID'].astype(str)
+# Local progress database, shared by every session in this process
+@st.cache_resource
+def load_progress_store():
+    return ProgressStore()
 
-    return data
+# Cache of downscaled question images, shared by every session
+@st.cache_resource
+def load_image_cache():
+    return ImageCache()
+
+# Full-text search index, built the first time someone searches and then shared
+# (one per bank version; the bank itself is not hashed)
+@st.cache_resource(max_entries=2)
+def load_search_index(_bank, version):
+    return SearchIndex(_bank.questions)
+
+# Near-duplicate clusters found by dedupe.py, as a cluster key per bank index
+@st.cache_resource(max_entries=2)
+def load_duplicate_clusters(_bank, version):
+    return cluster_keys(_bank, load_canonical_ids())
 
 # CLEAR CACHE - Button to clear the cache
 # if st.button("Clear Cache"):
 #     st.cache_data.clear()  # Clear the cache
 #     st.write("Cache cleared. Reload the page to pull updated data.")
 
-# Load the data from the CSV
-questions_df = load_data()
+# Load the question bank (a single lookup per full rerun; fragment reruns skip it)
+questions = load_data()
 
-# DEBUGGING - Display the first few rows of the DataFrame for verification
-# st.write(questions_df.head())
+# DEBUGGING - Display the first few questions for verification
+# st.write(questions.questions[:5])
 
-questions_df = load_data()
+progress = load_progress_store()
+image_cache = load_image_cache()
 
 # SECTION 2: Utility Functions
 
-# Shuffle answer options once per question
-def shuffle_answers(row, question_key):
-    if f"{question_key}_shuffled" not in st.session_state:
-        options = [row[letter] for letter in ['A', 'B', 'C', 'D', 'E', 'F'] if pd.notna(row[letter])]
-        random.shuffle(options)
-        st.session_state[f"{question_key}_shuffled"] = options
-    return st.session_state[f"{question_key}_shuffled"]
-
-# Function to extract and display multiple documentation links using regex
-def display_snowflake_docs(doc_string):
-    # Check if the input is a valid string, otherwise return an empty list
-    if isinstance(doc_string, str):
-        # Regex pattern to detect URLs
-        url_pattern = r'(https?://[^\s,]+)'
-        
-        # Find all URLs in the documentation string
-        doc_links = re.findall(url_pattern, doc_string)
-        
-        # Display each link as Snowflake Documentation(1), Snowflake Documentation(2), etc.
-        return [f"[Snowflake Documentation({i+1})]({link})" for i, link in enumerate(doc_links)]
-    else:
-        # If the value is not a string (e.g., NaN), return an empty list
-        return []
+# Number of upcoming questions whose images are prefetched
+IMAGE_PREFETCH_AHEAD = 3
 
-# Callback function to move to the next question
-def next_question():
-    st.session_state['current_question'] += 1
+# Session keys that survive a restart: who the user is and their study history
+PERSISTENT_KEYS = ('user_id', 'study_history')
+
+# The current session's quiz (all grading and navigation lives in QuizEngine)
+def get_quiz():
+    return st.session_state['quiz']
 
 # Callback function to exit and show the score
 def exit_quiz():
-    st.session_state['current_question'] = len(st.session_state['selected_questions'])
+    get_quiz().exit()
 
-# Callback function to restart the quiz
+# Callback function to restart the quiz (an abandoned quiz is not offered for resuming)
 def restart_quiz():
+    if 'quiz' in st.session_state:
+        get_quiz().close()
+    kept = {key: st.session_state[key] for key in PERSISTENT_KEYS if key in st.session_state}
     st.session_state.clear()
+    st.session_state.update(kept)
+
+# Study ID used to save progress, kept in the page URL so a refresh keeps it
+def get_user_id():
+    if 'user_id' not in st.session_state:
+        st.session_state['user_id'] = st.query_params.get('user') or uuid.uuid4().hex[:12]
+        st.query_params['user'] = st.session_state['user_id']
+    return st.session_state['user_id']
+
+# The user's study history, replayed from the progress database on first use
+def get_study_history():
+    if 'study_history' not in st.session_state:
+        history = StudyHistory()
+        user_id = get_user_id()
+        for qid, correct, answered_at in progress.user_answers(user_id):
+            if qid in questions.qid_lookup:
+                domain = questions.domain_labels[questions.domain_codes[questions.qid_lookup[qid]]]
+                history.record_answer(qid, domain, correct, now=answered_at)
+        for qid in progress.user_flags(user_id):
+            history.set_flag(qid, True)
+        st.session_state['study_history'] = history
+    return st.session_state['study_history']
+
+# Callback function to start the quiz (optionally only from a pool of indices into bank)
+def start_quiz_callback(pool=None, bank=None):
+    if bank is None:
+        bank = questions
+    if st.session_state.get('skip_duplicates'):
+        pool = one_per_cluster(range(len(bank)) if pool is None else pool,
+                               load_duplicate_clusters(bank, bank.version))
+    st.session_state['quiz'] = QuizEngine.start(
+        bank,
+        st.session_state['num_questions'],
+        st.session_state.get('quiz_mode', "Random"),
+        history=get_study_history(),
+        progress=progress,
+        user_id=get_user_id(),
+        pool=pool,
+    )
+    st.session_state['quiz_started'] = True
 
-# Callback function to start the quiz
-def start_quiz_callback():
+# Callback function to resume a quiz saved in the progress database
+def resume_quiz_callback(quiz_id, quiz_mode, num_questions):
+    st.session_state['quiz'] = QuizEngine.resume(
+        questions, quiz_id, quiz_mode, num_questions,
+        history=get_study_history(),
+        progress=progress,
+        user_id=get_user_id(),
+    )
     st.session_state['quiz_started'] = True
-    st.session_state['score'] = 0
-    st.session_state['answered_questions'] = 0  # Track how many questions were answered
-    st.session_state['current_question'] = 0
-
-    # Shuffle and select questions for the quiz
-    num_questions = st.session_state['num_questions']
-    st.session_state['selected_questions'] = questions_df.sample(n=int(num_questions)).reset_index(drop=True)
-
-    # Initialize domain totals for the selected questions in the quiz
-    st.session_state['domain_scores'] = {}
-    for _, row in st.session_state['selected_questions'].iterrows():
-        domain = row['Exam Domain'] if pd.notna(row['Exam Domain']) else 'N/A'
-        if domain not in st.session_state['domain_scores']:
-            st.session_state['domain_scores'][domain] = {'correct': 0, 'total': 0}
-        st.session_state['domain_scores'][domain]['total'] += 1  # Count total questions for each domain in the quiz
 
 # SECTION 3: Display Questions
 # Callback function to move to the next question
 def next_question_callback():
-    st.session_state['current_question'] += 1
+    get_quiz().next()
 
 # Callback function to go to the previous question
 def previous_question_callback():
-    st.session_state['current_question'] -= 1
+    get_quiz().previous()
+
+# Flag checkbox, with immediate state update
+@st.fragment
+def display_flag_checkbox(question_number):
+    quiz = get_quiz()
+    flag_status = st.checkbox(
+        "Flag this question",
+        value=quiz.is_flagged(question_number),  # Persist the state
+        key=f"flag_{question_number}"
+    )
+    quiz.flag(question_number, flag_status)  # Update flag state immediately
 
 # Function to display a single question with optional image and navigation
-def display_question(question_row, question_number, total_questions):
+@timed('render_question')
+def display_question(question, question_number, total_questions):
+    quiz = get_quiz()
     st.write(f"### Question {question_number + 1} of {total_questions}")
-    st.write(question_row['QUESTION'])
+    st.write(question.text)
+
+    # Check if there is an image for this question and display it (from the
+    # image cache, falling back to the remote URL until it has been fetched)
+    if question.image_url:
+        image = image_cache.get(question.image_url)
+        st.image(image if image is not None else question.image_url, caption="Related Image", width='stretch')
 
-    # Check if there is an image for this question and display it
-    if pd.notna(question_row.get('Image URL')):
-        st.image(question_row['Image URL'], caption="Related Image", use_column_width=True)
+    # Start fetching images for the next few questions in the background
+    image_cache.prefetch(upcoming.image_url for upcoming in quiz.upcoming(question_number, IMAGE_PREFETCH_AHEAD))
 
     # Unique key for each question
     question_key = f"question_{question_number}"
 
-    # Shuffle answers once per question
-    options = shuffle_answers(question_row, question_key)
+    # Record when the question was first shown (answer timings) and add it to the review
+    quiz.mark_shown(question_number)
+
+    # Shuffle answers once per question (as option letters, shown with their text)
+    options = quiz.options(question_number)
 
     # Determine if multiple answers are correct
-    correct_answers = [question_row[letter.strip()] for letter in question_row['CORRECT ANSWER'].split(',')]
+    correct_answers = question.correct_answers
     num_correct = len(correct_answers)
 
-    # Initialize session state for the question
-    if question_key not in st.session_state:
-        st.session_state[question_key] = {
-            'submitted': False,
-            'answered_correctly': False,
-            'selected_options': None,
-            'flagged': False  # Default value for flagging
-        }
-
-    # Flag checkbox, with immediate state update
-    flag_status = st.checkbox(
-        "Flag this question",
-        value=st.session_state[question_key]['flagged'],  # Persist the state
-        key=f"flag_{question_number}"
-    )
-    st.session_state[question_key]['flagged'] = flag_status  # Update flag state immediately
+    # Flag checkbox (its own fragment, so toggling it doesn't redraw the question)
+    display_flag_checkbox(question_number)
 
-    # Ensure the quiz review is updated with the latest flag status
-    update_quiz_review(question_row, question_key, correct_answers)
+    submitted = quiz.is_submitted(question_number)
+    previous_selection = quiz.selected(question_number)
 
     # Display answer options (disable after submission)
     selected_options = []
     if num_correct > 1:
         st.write(f"*(Select {num_correct} answers)*")
-        if st.session_state[question_key]['submitted']:
+        if submitted:
             # Show the previously selected options but disable editing
             st.multiselect(
                 "Your Answer:",
                 options,
-                default=st.session_state[question_key]['selected_options'],
+                default=list(previous_selection) if previous_selection else None,
+                format_func=question.option,
                 disabled=True,  # Disable input after submission
                 key=f"{question_key}_selected"
             )
@@ -156,15 +222,17 @@ def display_question(question_row, question_number, total_questions):
             selected_options = st.multiselect(
                 "Your Answer:",
                 options,
+                format_func=question.option,
                 key=f"{question_key}_selected"
             )
     else:
-        if st.session_state[question_key]['submitted']:
+        if submitted:
             # Show the previously selected option but disable editing
             st.radio(
                 "Your Answer:",
                 options,
-                index=options.index(st.session_state[question_key]['selected_options'][0]) if st.session_state[question_key]['selected_options'] else None,
+                index=options.index(previous_selection[0]) if previous_selection else None,
+                format_func=question.option,
                 disabled=True,  # Disable input after submission
                 key=f"{question_key}_selected"
             )
@@ -172,45 +240,33 @@ def display_question(question_row, question_number, total_questions):
             selected_option = st.radio(
                 "Your Answer:",
                 options,
+                format_func=question.option,
                 key=f"{question_key}_selected",
                 index=None  # No option pre-selected
             )
             selected_options = [selected_option] if selected_option else []
 
     # 'Submit' button should only be shown if the answer has not yet been submitted
-    if not st.session_state[question_key]['submitted']:
+    if not submitted:
         if st.button("Submit", key=f"submit_{question_number}"):
-            # Ensure the correct number of options are selected for multi-answer questions
-            if len(selected_options) != num_correct:
-                st.warning(f"Please select exactly {num_correct} option(s).")
-            else:
-                st.session_state[question_key]['submitted'] = True
-                st.session_state[question_key]['selected_options'] = selected_options
-
-                # Check if the answer is correct
-                if set(selected_options) == set(correct_answers):
-                    st.session_state['score'] += 1
-                    st.session_state[question_key]['answered_correctly'] = True
-                else:
-                    st.session_state[question_key]['answered_correctly'] = False
-
-                # Increment answered questions count
-                st.session_state['answered_questions'] += 1
-
-                # Update the quiz review after submission
-                update_quiz_review(question_row, question_key, correct_answers)
+            # Grade the answer (the engine checks the number of options selected)
+            try:
+                quiz.answer(question_number, selected_options)
+                submitted = True
+            except ValueError as e:
+                st.warning(str(e))
 
     # Show feedback and explanation after submission
-    if st.session_state[question_key]['submitted']:
-        if st.session_state[question_key]['answered_correctly']:
+    if submitted:
+        if quiz.is_correct(question_number):
             st.success("Correct!",icon="✅")
         else:
             st.error(f"Incorrect! The correct answer(s): {', '.join(correct_answers)}",icon="❌")
 
 
     # Show explanation, domain, and documentation
-        if pd.notna(question_row['EXPLANATION/NOTES']):
-            explanation = question_row['EXPLANATION/NOTES'].replace('\\n', '\n')  # Ensure line breaks are preserved
+        if question.explanation:
+            explanation = question.explanation  # Line breaks are unescaped at load time
             st.markdown(f"""
                 <div style="background-color: #34495e; padding: 10px; border-radius: 5px;">
                     <strong>Explanation/Notes:</strong><br>
@@ -218,14 +274,12 @@ def display_question(question_row, question_number, total_questions):
                 </div>
                 """, unsafe_allow_html=True)  # Use custom HTML for the colored box
             
-        if pd.notna(question_row['Exam Domain']):
-            domain = question_row['Exam Domain'] if pd.notna(question_row['Exam Domain']) else "N/A"  # Fetch the Exam Domain
-            st.write(f"**Exam Domain:** {domain}")
+        if question.domain:
+            st.write(f"**Exam Domain:** {question.domain}")
 
-        if pd.notna(question_row['Snowflake Documentation']):
-            doc_links = display_snowflake_docs(question_row['Snowflake Documentation'])
-            for link in doc_links:
-                st.write(link)
+        # Documentation links are parsed once when the bank is loaded
+        for link in question.doc_links:
+            st.write(link)
 
     # Navigation buttons: Previous is always visible
     col1, col2 = st.columns([1, 1])
@@ -237,81 +291,31 @@ def display_question(question_row, question_number, total_questions):
 
     # Handle the last question
     if question_number == total_questions - 1:
-        if st.session_state[question_key]['submitted']:
+        if submitted:
             with col2:
                 st.button("Exit and View Score", key=f"exit_{question_number}", on_click=exit_quiz)
     else:
         # Next button: Move to the next question (visible only after submission)
-        if st.session_state[question_key]['submitted']:
+        if submitted:
             with col2:
                 st.button("Next", key=f"next_{question_number}", on_click=next_question_callback)
 
 
-# Function to update the quiz review list
-def update_quiz_review(question_row, question_key, correct_answers):
-    """Update the quiz review with the current question's data."""
-    if 'quiz_review' not in st.session_state:
-        st.session_state['quiz_review'] = pd.DataFrame(columns=[
-            'Question', 'Your Answer', 'Correct Answer', 'Correct?', 
-            'Explanation', 'Snowflake Documentation', 'Flagged', 'Exam Domain'
-        ])
-
-    # Determine if the answer was correct
-    is_correct = st.session_state[question_key]['answered_correctly']
-
-    # Prepare the new row for the review DataFrame
-    new_row = {
-        'Question': question_row['QUESTION'],
-        'Your Answer': ', '.join(st.session_state[question_key]['selected_options']) if st.session_state[question_key]['selected_options'] else 'N/A',
-        'Correct Answer': ', '.join(correct_answers),
-        'Correct?': 'Yes' if is_correct else 'No',
-        'Explanation': question_row['EXPLANATION/NOTES'] if pd.notna(question_row['EXPLANATION/NOTES']) else 'N/A',
-        'Snowflake Documentation': ', '.join(display_snowflake_docs(question_row['Snowflake Documentation'])),
-        'Flagged': st.session_state[question_key]['flagged'],
-        'Exam Domain': question_row.get('Exam Domain', 'N/A')
-    }
-
-    # Remove any existing entry for this question
-    st.session_state['quiz_review'] = st.session_state['quiz_review'][
-        st.session_state['quiz_review']['Question'] != question_row['QUESTION']
-    ]
-
-    # Add the new row using pd.concat
-    st.session_state['quiz_review'] = pd.concat(
-        [st.session_state['quiz_review'], pd.DataFrame([new_row])],
-        ignore_index=True
-    )
-
-
-# Function to create the review dataframe of the quiz at the end
-def get_review_dataframe(flagged_only=False):
-    """Fetch the quiz review DataFrame with optional filtering for flagged questions."""
-    if 'quiz_review' not in st.session_state or st.session_state['quiz_review'].empty:
-        return pd.DataFrame()  # Return empty DataFrame if no data exists
-
-    review_df = st.session_state['quiz_review'].copy()
-
-    if flagged_only:
-        review_df = review_df[review_df['Flagged'] == True]
-
-    # Replace the 'Snowflake Documentation' column with URLs
-    review_df['Snowflake Documentation'] = review_df['Snowflake Documentation'].apply(
-        lambda doc: ', '.join(re.findall(r'\((https?://[^\)]+)\)', doc))
-    )
-
-    return review_df
-
 def display_domain_scores():
-    """Calculate and display the domain breakdown."""
-    review_df = get_review_dataframe()
-    if review_df.empty:
+    """Display the domain breakdown from the running per-domain counters."""
+    breakdown = get_quiz().domain_breakdown()
+    if not any(answered for _, _, answered, _ in breakdown):
         st.write("No data available for domain scores.")
         return
 
-    domain_summary = review_df.groupby('Exam Domain')['Correct?'].apply(
-        lambda x: f"{x.str.count('Yes').sum()}/{len(x)} ({(x.str.count('Yes').sum() / len(x)) * 100:.2f}%)"
-    ).reset_index()
-    domain_summary.columns = ['Exam Domain', 'Score/Percentage']
+    domain_summary = pd.DataFrame({
+        'Exam Domain': [domain for domain, _, _, _ in breakdown],
+        'Score/Percentage': [
+            f"{correct}/{answered} ({correct / answered * 100:.2f}%)" if answered else "N/A"
+            for _, correct, answered, _ in breakdown
+        ],
+        'Answered': [f"{answered} of {total}" for _, _, answered, total in breakdown],
+    })
 
     st.write("## Domain Score Breakdown")
     st.write(domain_summary.to_html(index=False, escape=False), unsafe_allow_html=True)
@@ -319,7 +323,7 @@ def display_domain_scores():
 
 def display_all_questions():
     """Display all questions in the review."""
-    review_df = get_review_dataframe()
+    review_df = get_quiz().review_dataframe()
 
     if review_df is None or review_df.empty:
         st.write("No questions to review.")
@@ -332,7 +336,7 @@ def display_all_questions():
 
 def display_flagged_questions():
     """Display only flagged questions in the review."""
-    review_df = get_review_dataframe(flagged_only=True)
+    review_df = get_quiz().review_dataframe(flagged_only=True)
 
     if review_df is None or review_df.empty:
         st.write("No flagged questions.")
@@ -344,6 +348,154 @@ def display_flagged_questions():
 
 
 
+def display_review_export():
+    """Offer the quiz review as a CSV or Parquet download."""
+    quiz = get_quiz()
+    if not quiz.reviewed:
+        return
+
+    st.write("## Export Review")
+    export_format = st.radio("Format:", list(EXPORT_FORMATS), horizontal=True, key='export_format')
+    flagged_only = st.checkbox("Flagged questions only", key='export_flagged_only')
+    incorrect_only = st.checkbox("Incorrect answers only", key='export_incorrect_only')
+
+    # The file is generated in chunks only when the button is clicked, straight
+    # from the review rows, without building a DataFrame copy first
+    extension, mime, _ = EXPORT_FORMATS[export_format]
+    st.download_button(
+        "Download Review",
+        data=partial(export_review, quiz.review_rows, REVIEW_COLUMNS, export_format, flagged_only, incorrect_only),
+        file_name=f"snowpro_quiz_review.{extension}",
+        mime=mime,
+    )
+
+
+# Most search results used to build a quiz, and how many of them are listed
+SEARCH_RESULT_LIMIT = 200
+SEARCH_RESULTS_SHOWN = 10
+
+def display_question_search():
+    """Search the question bank and offer a quiz built from the results."""
+    st.write("### Search Questions")
+    query = st.text_input(
+        "Search questions, answers and explanations:",
+        placeholder="e.g. snowpipe, time travel, clust*, or a QID",
+        key='search_query'
+    ).strip()
+    if not query:
+        return
+
+    with span('search'):
+        pool = [index for index, _ in load_search_index(questions, questions.version).search(query, limit=SEARCH_RESULT_LIMIT)]
+
+    # An exact QID goes to the top of the results
+    if query in questions.qid_lookup:
+        index = questions.qid_lookup[query]
+        pool = [index] + [other for other in pool if other != index]
+
+    if not pool:
+        st.write("No matching questions.")
+        return
+
+    st.write(f"{len(pool)} matching question(s):")
+    for index in pool[:SEARCH_RESULTS_SHOWN]:
+        st.write(f"**QID {questions[index].qid}:** {questions[index].text}")
+
+    st.button(
+        "Quiz Me on These Results",
+        on_click=start_quiz_callback,
+        kwargs={'pool': pool, 'bank': questions},
+        help="Uses the number of questions and quiz mode chosen above, up to the number of results"
+    )
+
+
+# Mock exam countdown, refreshed every second on its own; the deadline itself
+# is kept by the quiz, so the exam ends on time even if the page isn't open
+@st.fragment(run_every=1)
+def display_countdown():
+    quiz = st.session_state.get('quiz')
+    if quiz is None or quiz.deadline is None:
+        return
+    if quiz.time_expired:
+        st.rerun()  # Time's up: go to the score
+    minutes, seconds = divmod(int(quiz.seconds_left), 60)
+    st.write(f"⏱️ **Time left:** {minutes}:{seconds:02d}")
+
+# The question card, navigation and quiz controls, rerun on their own as a
+# fragment: answering or moving between questions doesn't rerun the whole app
+@st.fragment
+def display_quiz_view():
+    count('quiz_view_rerun')
+    quiz = st.session_state.get('quiz')
+    if quiz is None or quiz.finished:
+        st.rerun()  # Exited or restarted: the rest of the page changes too
+
+    total_questions = quiz.num_questions
+    current_q = quiz.current
+
+    if quiz.deadline is not None:
+        display_countdown()
+
+    question = quiz.question(current_q)
+    display_question(question, current_q, total_questions)
+    st.progress((current_q + 1) / total_questions)
+
+     # Always display the "Restart Quiz" and "Exit and View Score" buttons
+    st.write("---")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        if not (current_q == total_questions - 1 and quiz.is_submitted(current_q)):
+            st.button("Exit and View Score", on_click=exit_quiz)
+    with col2:
+        st.button("Restart Quiz", on_click=restart_quiz)
+        st.markdown("⚠️  :grey[In beta, please share feedback!]")
+
+
+# Hidden profiling panel, shown in the sidebar with ?profile=1 in the page URL
+def display_profiling_panel():
+    with st.sidebar:
+        st.write("### Profiling")
+        if not profiler.enabled:
+            st.write(f"Set the `{PROFILE_ENV}` environment variable and restart the app to collect timings.")
+            return
+
+        stats = profiler.span_stats()
+        if stats:
+            st.dataframe(
+                pd.DataFrame(stats, columns=['Span', 'Calls', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)']).round(3),
+                hide_index=True
+            )
+        st.write(profiler.counters())
+        st.button("Write to Log", on_click=profiler.flush, help=f"Appends to {profiler.log_path} (JSON lines)")
+
+
+# Hidden question statistics panel, shown in the sidebar with ?analytics=1 in the page URL.
+# The report is built from the progress database when the panel opens (and on Refresh),
+# so it covers the answers saved by every server process, not just this one
+def refresh_cohort_report():
+    progress.flush()  # Include this process's queued answers
+    st.session_state['cohort_report'] = CohortStats.from_progress(progress).report(questions)
+
+def display_analytics_panel():
+    with st.sidebar:
+        st.write("### Question Statistics")
+        if 'cohort_report' not in st.session_state:
+            refresh_cohort_report()
+        st.button("Refresh", on_click=refresh_cohort_report, key='refresh_cohort_report')
+        report = st.session_state['cohort_report']
+        if report.empty:
+            st.write("No answers yet.")
+            return
+
+        st.write(f"{report['Attempts'].sum()} answers to {len(report)} questions")
+        suspects = report[report['Likely Wrong Key']]
+        if len(suspects):
+            st.write(f"**{len(suspects)} question(s) with a likely wrong answer key** (a distractor beats a marked answer):")
+            st.dataframe(suspects, hide_index=True)
+        st.dataframe(report.sort_values('Discrimination').round(3), hide_index=True)
+
+
 # SECTION 5: Main Quiz Logic and Final Output
 # Function to start the quiz interface
 def start_quiz():
@@ -365,16 +517,14 @@ def start_quiz():
     #     # Convert QID input to string to handle any type differences
     #     qid_str = str(qid)
 
-    #     # Ensure QID column is treated as string for comparison
-    #     questions_df['QID'] = questions_df['QID'].astype(str)
-
-    #     # Search for the question in the DataFrame by QID
-    #     matching_questions = questions_df[questions_df['QID'] == qid_str]
+    #     # Search for the question in the bank by QID
+    #     matching_questions = [index for index, question in enumerate(questions.questions) if question.qid == qid_str]
 
     #     # Check if a matching question was found
-    #     if not matching_questions.empty:
-    #         question_row = matching_questions.iloc[0]  # Get the first matching row
-    #         display_question(question_row, question_number=0, total_questions=1)  # Display the question for testing
+    #     if matching_questions:
+    #         index = matching_questions[0]  # Get the first matching question
+    #         st.session_state['quiz'] = QuizEngine(questions, 'test', "Random", 1, [index])
+    #         display_question(questions[index], question_number=0, total_questions=1)  # Display the question for testing
     #     else:
     #         st.error("Question not found! Please ensure you entered the correct QID.")
 
@@ -385,12 +535,6 @@ def start_quiz():
     # Initialize session state variables
     if 'quiz_started' not in st.session_state:
         st.session_state['quiz_started'] = False
-    if 'score' not in st.session_state:
-        st.session_state['score'] = 0
-    if 'current_question' not in st.session_state:
-        st.session_state['current_question'] = 0
-    if 'answered_questions' not in st.session_state:
-        st.session_state['answered_questions'] = 0
 
     # Display instructions and number of questions input before starting the quiz
     if not st.session_state['quiz_started']:
@@ -403,7 +547,7 @@ def start_quiz():
             3. After each question you will see if you answered correctly or not, as well as the explanation and link(s) to relevant Snowflake Documentation.
             4. Click :blue[**[Next]**] to move to the next question.
             5. Use :blue[**[Exit and View Score]**] to end the quiz at any time to see how you scored on *only the questions you submitted*.
-            6. Once the quiz ends (either via :blue[**[Exit and View Score]**] or by completing all questions), click :blue[**[Review Quiz]**] to review all the questions and your responses in a table that you can even download to a .csv! (Use this to keep track of concepts and Snowflake Documentation that would be helpful to review)
+            6. Once the quiz ends (either via :blue[**[Exit and View Score]**] or by completing all questions), click :blue[**[Review Quiz]**] to review all the questions and your responses in a table, or use :blue[**[Download Review]**] to save them as a .csv or .parquet file! (Use this to keep track of concepts and Snowflake Documentation that would be helpful to review)
             7. Use :blue[**[Restart Quiz]**] to **reset** the quiz. :blue-background[Note: You will not get a score or an ability to review the questions when using :blue[**[Restart Quiz]**].]
         """)
         st.markdown("""Lastly, mistakes happen, if you find a bug in the quiz or an inconsistency in a question/answer, please flag those and share feedback directly or via the app's GitHub repository.""")
@@ -412,48 +556,70 @@ def start_quiz():
         st.session_state['num_questions'] = st.number_input(
             "Input number of questions:",
             min_value=1,
-            max_value=len(questions_df),
+            max_value=len(questions),
             value=100,
             help="Maximum 1005 questions"
         )
 
+        # Quiz mode selection
+        st.session_state['quiz_mode'] = st.radio(
+            "Quiz mode:",
+            QUIZ_MODES,
+            horizontal=True,
+            help="Adaptive quizzes favor questions you missed, flagged or haven't seen in a while, and your weaker domains. "
+                 f"Mock exams follow the exam's domain weights and are timed at {MOCK_EXAM_SECONDS_PER_QUESTION} seconds per question, like the real exam"
+        )
+
+        # Near-duplicate questions are only skipped when the user opts in, since
+        # that can leave fewer questions than the number asked for
+        st.checkbox(
+            "Skip near-duplicate questions",
+            value=False,
+            key='skip_duplicates',
+            help="The bank has some questions that are reworded copies of each other; only one of each group is asked"
+        )
+
+        # Study ID used to save progress between visits
+        user_id = st.text_input(
+            "Study ID:",
+            value=get_user_id(),
+            help="Your progress is saved under this ID (it's also in the page URL). Enter the same ID on another visit to resume a quiz and keep your study history."
+        ).strip()
+        if user_id and user_id != st.session_state['user_id']:
+            st.session_state['user_id'] = user_id
+            st.query_params['user'] = user_id
+            st.session_state.pop('study_history', None)
+
         # Start Quiz button
         st.button("Start Quiz", on_click=start_quiz_callback)
 
-    else:
-        total_questions = len(st.session_state['selected_questions'])
-        current_q = st.session_state['current_question']
+        # Resume button for a quiz that was left unfinished
+        unfinished_quiz = progress.latest_unfinished_quiz(get_user_id())
+        if unfinished_quiz:
+            st.button("Resume Quiz", on_click=resume_quiz_callback, args=unfinished_quiz)
 
-        if current_q < total_questions:
-            question_row = st.session_state['selected_questions'].iloc[current_q]
-            display_question(question_row, current_q, total_questions)
-            st.progress((current_q + 1) / total_questions)
+        # Search the bank and build a quiz from the results
+        st.write("---")
+        display_question_search()
 
-             # Always display the "Restart Quiz" and "Exit and View Score" buttons
-            st.write("---")
-            col1, col2 = st.columns(2)
+    else:
+        quiz = get_quiz()
 
-            with col1:
-                if not (current_q == total_questions - 1 and st.session_state.get(f'question_{current_q}') and st.session_state[f'question_{current_q}']['submitted']):
-                    st.button("Exit and View Score", on_click=exit_quiz)
-            with col2:
-                st.button("Restart Quiz", on_click=restart_quiz)
-                st.markdown("⚠️  :grey[In beta, please share feedback!]")
+        # A mock exam that ran out of time ends as if the user had exited
+        if quiz.time_expired and quiz.current < quiz.num_questions:
+            quiz.exit()
+
+        if not quiz.finished:
+            display_quiz_view()
 
         else:
-            answered_questions = st.session_state['answered_questions']
-            total_selected_questions = st.session_state['num_questions']
-            
-            # Calculate percentage
-            if answered_questions > 0:
-                percentage = (st.session_state['score'] / answered_questions) * 100
-            else:
-                percentage = 0.0
-            
+            answered_questions = quiz.answered
+            total_selected_questions = quiz.num_questions
+
             # Display results with percentage
             st.write(f"## Quiz Completed!")
-            st.write(f"**Your Score:** {st.session_state['score']} out of {answered_questions} questions answered (Total exam: {total_selected_questions})")
-            st.write(f"**Percentage:** {percentage:.2f}%")
+            st.write(f"**Your Score:** {quiz.score} out of {answered_questions} questions answered (Total exam: {total_selected_questions})")
+            st.write(f"**Percentage:** {quiz.percentage:.2f}%")
 
             # Display domain-wise breakdown after quiz completion
             display_domain_scores()
@@ -465,6 +631,9 @@ def start_quiz():
             if st.button("Review All Questions"):
                 display_all_questions()
 
+            # Download the review as a file
+            display_review_export()
+
             # Button to restart the quiz
             st.button("Restart Quiz", on_click=restart_quiz)
             
@@ -472,9 +641,15 @@ def start_quiz():
 
 # Run the quiz app
 if __name__ == '__main__':
-    start_quiz()
+    count('rerun')
+    with span('rerun'):
+        start_quiz()
+    if st.query_params.get('profile') == '1':
+        display_profiling_panel()
+    if st.query_params.get('analytics') == '1':
+        display_analytics_panel()
 
 
 
  #  DEBUGGING - Check if the image URL is correct for debugging purposes
-        # st.write(f"Image URL for this question: {question_row['Image URL']}")
\ No newline at end of file
+        # st.write(f"Image URL for this question: {question.image_url}")
\ No newline at end of file
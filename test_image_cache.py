@@ -0,0 +1,168 @@
+import io
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import image_cache
+from image_cache import DISPLAY_WIDTH, RETRY_AFTER, ImageCache
+
+
+def png(width, height, noise=True):
+    """PNG bytes of a random-noise (incompressible) or blank image."""
+    if noise:
+        image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    else:
+        image = Image.new('RGB', (width, height), 'white')
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+class ImageServer:
+    """A local HTTP server for test images, counting the requests for each path."""
+
+    def __init__(self):
+        self.images = {}
+        self.truncated = set()  # Paths whose responses are cut short
+        self.requests = {}
+        self.release = threading.Event()  # Cleared to hold responses back
+        self.release.set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests[self.path] = server.requests.get(self.path, 0) + 1
+                server.release.wait()
+                data = server.images.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(data) + (100 if self.path in server.truncated else 0)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def add(self, path, data):
+        self.images[path] = data
+        return f"http://127.0.0.1:{self._httpd.server_port}{path}"
+
+    def close(self):
+        self.release.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    yield server
+    server.close()
+
+
+def test_wide_images_are_downscaled(server, tmp_path):
+    cache = ImageCache(tmp_path)
+    wide = server.add('/wide.png', png(DISPLAY_WIDTH * 2, 300, noise=False))
+    small = server.add('/small.png', png(64, 64))
+
+    with Image.open(io.BytesIO(cache.get(wide, wait=True))) as image:
+        assert image.format == 'PNG'
+        assert image.size == (DISPLAY_WIDTH, 150)
+    assert cache.get(small, wait=True) == server.images['/small.png']
+
+
+def test_miss_returns_none_and_fetches_in_background(server, tmp_path):
+    cache = ImageCache(tmp_path)
+    url = server.add('/slow.png', png(64, 64))
+
+    server.release.clear()
+    started = time.monotonic()
+    assert cache.get(url) is None
+    assert time.monotonic() - started < 1
+    server.release.set()
+
+    assert cache.get(url, wait=True) == server.images['/slow.png']
+    assert server.requests['/slow.png'] == 1
+
+
+def test_memory_and_disk_hits(server, tmp_path):
+    url = server.add('/image.png', png(64, 64))
+    cache = ImageCache(tmp_path)
+    data = cache.get(url, wait=True)
+
+    assert cache.get(url) == data
+    # A new cache over the same directory reads the image from disk
+    assert ImageCache(tmp_path).get(url) == data
+    assert server.requests['/image.png'] == 1
+
+
+def test_failed_fetch_is_retried_after_the_retry_window(server, tmp_path, monkeypatch):
+    cache = ImageCache(tmp_path)
+    url = server.add('/missing.png', None)
+
+    assert cache.get(url, wait=True) is None
+    assert cache.get(url, wait=True) is None
+    cache.prefetch([url])
+    assert server.requests['/missing.png'] == 1
+
+    now = time.monotonic() + RETRY_AFTER + 1
+    monkeypatch.setattr(image_cache, 'time', SimpleNamespace(monotonic=lambda: now))
+    server.images['/missing.png'] = png(64, 64)
+    assert cache.get(url, wait=True) == server.images['/missing.png']
+    assert server.requests['/missing.png'] == 2
+
+
+def test_truncated_response_counts_as_failed(server, tmp_path):
+    cache = ImageCache(tmp_path)
+    url = server.add('/truncated.png', png(64, 64))
+    server.truncated.add('/truncated.png')
+
+    assert cache.get(url, wait=True) is None
+    assert cache.get(url, wait=True) is None
+    assert server.requests['/truncated.png'] == 1
+
+
+def test_least_recently_used_images_are_evicted_from_disk(server, tmp_path):
+    urls = [server.add(f"/{i}.png", png(64, 64)) for i in range(3)]
+    size = max(len(data) for data in server.images.values())
+    cache = ImageCache(tmp_path, max_disk_bytes=size * 2.5)
+    cache.get(urls[0], wait=True)
+    cache.get(urls[1], wait=True)
+
+    # Reading the first image from disk makes the second the least recently used
+    cache = ImageCache(tmp_path, max_disk_bytes=size * 2.5)
+    cache.get(urls[0])
+    cache.get(urls[2], wait=True)
+
+    assert len(os.listdir(tmp_path / 'blobs')) == 2
+    fresh = ImageCache(tmp_path)
+    assert fresh.get(urls[0]) == server.images['/0.png']
+    assert fresh.get(urls[2]) == server.images['/2.png']
+    assert fresh.get(urls[1]) is None
+
+
+def test_least_recently_used_images_are_evicted_from_memory(server, tmp_path):
+    urls = [server.add(f"/{i}.png", png(64, 64)) for i in range(3)]
+    size = max(len(data) for data in server.images.values())
+    # The disk cache only keeps the newest image, so misses go back to the server
+    cache = ImageCache(tmp_path, max_disk_bytes=size, max_memory_bytes=size * 2.5)
+    cache.get(urls[0], wait=True)
+    cache.get(urls[1], wait=True)
+    cache.get(urls[0])  # Now more recently used than the second image
+    cache.get(urls[2], wait=True)
+
+    assert cache.get(urls[0]) == server.images['/0.png']
+    assert cache.get(urls[1], wait=True) == server.images['/1.png']
+    assert server.requests == {'/0.png': 1, '/1.png': 2, '/2.png': 1}
@@ -0,0 +1,191 @@
+import random
+
+import pytest
+
+from progress_store import ProgressStore
+from question_bank import OPTION_LETTERS, Question, QuestionBank
+from quiz_engine import QuizEngine
+
+DOMAINS = ['1.0 Alpha Concepts (60%)', '2.0 Beta Concepts (40%)']
+
+
+def make_question(number):
+    """Question number of a small test bank: every third one has two answers."""
+    correct_letters = ('A', 'C') if number % 3 == 0 else ('B',)
+    options = tuple(f"Option {letter} of {number}" if letter in 'ABCD' else None for letter in OPTION_LETTERS)
+    domain_code = number % 2
+    return Question(f"Q{number}", f"Question {number}", options, correct_letters, None, None, (), (), None,
+                    DOMAINS[domain_code], domain_code)
+
+
+def wrong_letters(question):
+    return [letter for letter in 'ABCD' if letter not in question.correct_letters][:len(question.correct_letters)]
+
+
+def answer_all(quiz):
+    while not quiz.finished:
+        quiz.answer(quiz.current, quiz.question(quiz.current).correct_letters)
+        quiz.next()
+
+
+@pytest.fixture
+def bank():
+    return QuestionBank(tuple(make_question(number) for number in range(30)))
+
+
+@pytest.fixture
+def progress(tmp_path):
+    progress = ProgressStore(str(tmp_path / 'progress.db'))
+    yield progress
+    progress.close()
+
+
+def test_answers_are_graded_and_scored(bank):
+    quiz = QuizEngine.start(bank, 5, rng=random.Random(0))
+
+    first, second = quiz.question(0), quiz.question(1)
+    assert quiz.answer(0, first.correct_letters)
+    assert not quiz.answer(1, wrong_letters(second))
+    assert (quiz.score, quiz.answered, quiz.percentage) == (1, 2, 50.0)
+    assert quiz.is_correct(0) and not quiz.is_correct(1)
+    assert quiz.selected(1) == tuple(wrong_letters(second))
+
+    with pytest.raises(ValueError):
+        quiz.answer(0, first.correct_letters)  # Already submitted
+    with pytest.raises(ValueError):
+        quiz.answer(2, list(quiz.question(2).correct_letters) + ['D'])  # Too many options
+
+    domains = {label: (correct, answered, total) for label, correct, answered, total in quiz.domain_breakdown()}
+    assert sum(total for _, _, total in domains.values()) == 5
+    assert sum(answered for _, answered, _ in domains.values()) == 2
+
+
+def test_navigation_and_exit(bank):
+    quiz = QuizEngine.start(bank, 3, rng=random.Random(0))
+
+    quiz.next()
+    quiz.next()
+    quiz.previous()
+    assert quiz.current == 1 and not quiz.finished
+    quiz.exit()
+    assert quiz.finished
+
+
+def test_options_are_shuffled_once_per_question(bank):
+    quiz = QuizEngine.start(bank, 3, rng=random.Random(0))
+
+    options = quiz.options(0)
+    assert sorted(options) == ['A', 'B', 'C', 'D']
+    assert quiz.options(0) == options
+
+
+def test_flags_and_review_rows(bank):
+    quiz = QuizEngine.start(bank, 3, rng=random.Random(0))
+    for question_number in range(3):
+        quiz.mark_shown(question_number)
+    quiz.answer(0, quiz.question(0).correct_letters)
+    quiz.flag(1, True)
+
+    rows = list(quiz.review_rows())
+    assert [row['Question'] for row in rows] == [quiz.question(number).text for number in range(3)]
+    assert rows[0]['Correct?'] == 'Yes'
+    assert rows[1]['Your Answer'] == 'N/A'
+
+    flagged = list(quiz.review_rows(flagged_only=True))
+    assert [row['Question'] for row in flagged] == [quiz.question(1).text]
+
+    quiz.flag(1, False)
+    assert list(quiz.review_rows(flagged_only=True)) == []
+
+
+def test_resume_restores_answers_flags_and_position(bank, progress):
+    quiz = QuizEngine.start(bank, 4, progress=progress, user_id='user', rng=random.Random(0))
+    quiz.answer(0, quiz.question(0).correct_letters)
+    quiz.next()
+    quiz.answer(1, wrong_letters(quiz.question(1)))
+    quiz.flag(1, True)
+    progress.flush()
+
+    resumed = QuizEngine.resume(bank, quiz.quiz_id, 'Random', 4, progress=progress, user_id='user')
+    assert list(resumed.selected_questions) == list(quiz.selected_questions)
+    assert (resumed.score, resumed.answered, resumed.current) == (1, 2, 2)
+    assert resumed.is_flagged(1) and not resumed.is_flagged(0)
+
+
+def test_flags_are_kept_per_quiz(bank, progress):
+    first = QuizEngine.start(bank, 30, progress=progress, user_id='user', rng=random.Random(0))
+    second = QuizEngine.start(bank, 30, progress=progress, user_id='user', rng=random.Random(1))
+    qid = first.question(0).qid
+    first.flag(0, True)
+    second_number = [second.question(number).qid for number in range(30)].index(qid)
+    second.flag(second_number, True)
+    second.flag(second_number, False)
+    progress.flush()
+
+    resumed = QuizEngine.resume(bank, first.quiz_id, 'Random', 30, progress=progress, user_id='user')
+    assert resumed.is_flagged(0)
+
+
+def test_mock_exam_follows_the_blueprint_and_expires(bank, progress):
+    quiz = QuizEngine.start(bank, 10, "Mock Exam", progress=progress, user_id='user', rng=random.Random(0))
+
+    domains = [quiz.question(number).domain_code for number in range(10)]
+    assert (domains.count(0), domains.count(1)) == (6, 4)
+    assert quiz.seconds_left > 0
+
+    quiz.deadline -= quiz.seconds_left + 1
+    assert quiz.time_expired and quiz.finished
+    with pytest.raises(ValueError):
+        quiz.answer(0, quiz.question(0).correct_letters)
+
+
+def test_adaptive_quiz_draws_without_repeats(bank):
+    quiz = QuizEngine.start(bank, 10, "Adaptive", rng=random.Random(0))
+    answer_all(quiz)
+
+    assert len(quiz.selected_questions) == 10
+    assert len(set(quiz.selected_questions)) == 10
+
+
+def test_adaptive_quiz_is_reproducible_with_a_seeded_rng(bank):
+    draws = []
+    for _ in range(2):
+        quiz = QuizEngine.start(bank, 8, "Adaptive", rng=random.Random(3))
+        answer_all(quiz)
+        draws.append(list(quiz.selected_questions))
+    assert draws[0] == draws[1]
+
+
+def test_quiz_only_uses_its_pool(bank):
+    pool = [1, 4, 7, 10, 13]
+    for mode in ("Random", "Adaptive", "Mock Exam"):
+        quiz = QuizEngine.start(bank, 10, mode, pool=pool, rng=random.Random(0))
+        answer_all(quiz)
+        assert sorted(quiz.selected_questions) == pool
+
+
+def test_resumed_adaptive_quiz_keeps_its_pool(bank, progress):
+    pool = list(range(10))
+    quiz = QuizEngine.start(bank, 8, "Adaptive", progress=progress, user_id='user', pool=pool,
+                            rng=random.Random(0))
+    quiz.answer(0, quiz.question(0).correct_letters)
+    quiz.next()
+    progress.flush()
+
+    resumed = QuizEngine.resume(bank, quiz.quiz_id, "Adaptive", 8, progress=progress, user_id='user',
+                                rng=random.Random(1))
+    answer_all(resumed)
+    assert len(resumed.selected_questions) == 8
+    assert set(resumed.selected_questions) <= set(pool)
+
+
+def test_adaptive_quiz_ends_when_its_pool_runs_out(bank, progress):
+    quiz = QuizEngine.start(bank, 3, "Adaptive", progress=progress, user_id='user', pool=[2, 5, 8],
+                            rng=random.Random(0))
+    answer_all(quiz)
+    progress.flush()
+
+    # Saved with more questions than the pool has left, e.g. after the bank lost some
+    resumed = QuizEngine.resume(bank, quiz.quiz_id, "Adaptive", 5, progress=progress, user_id='user')
+    assert resumed.finished
+    assert resumed.num_questions == 3